@@ -1,10 +1,8 @@
 import os
 import pandas as pd
-from matplotlib import pyplot as plt
 import numpy as np
-import statistics as stat
-import scipy.stats as stats
 import argparse
+from stats_engine import CumulativeQuantiles
 
 """
 TODO:
@@ -26,48 +24,46 @@ def parse_args():
 
     return args
 
-def get_median(df):
-    try:
-        return stat.median(df.values)
-    except:
-        return np.nan
-
-# TODO: pull from toolstats
-def get_ci(s,  alpha=0.95, p=0.5, n_thresh=10):
-    n = len(s)
-    q = np.quantile(s, p)
-    eta = stats.norm.ppf((1+alpha)/2.0) # 1.96 for alpha = 0.95
-    lo_rank = max(int(np.floor(n * p - eta * np.sqrt(n * p * (1-p)))), 0)
-    hi_rank = min(int(np.ceil(n * p + eta * np.sqrt(n * p * (1-p))) + 1), n-1)
-    s_sorted = sorted(s.tolist())
-    q_ci_lo = s_sorted[lo_rank]
-    q_ci_hi = s_sorted[hi_rank]
-    return q_ci_hi, q_ci_lo
-
-def aggregate_results(df):
-    agg_stats = pd.DataFrame(columns = ['exp_command',
-                                        'order_type',
-                                        'run_num',
-                                        'result',
-                                        'median_cmltv',
-                                        'ci_hi_cmltv',
-                                        'ci_lo_cmltv'])
-
-    for idx, group in df.groupby(['exp_command', 'order_type']):
-        for i in range(0,480,2):
-            if idx[1] == "random":
-                i = i + 1
-            result = group[group['run_num'] == i]['result'].values[0]
-            agg_result = group[group['run_num'] <= i]['result']
-            med = get_median(agg_result)
-            ci_hi,ci_lo = get_ci(agg_result)
-            agg_stats.loc[len(agg_stats)] = list(idx) + [i, result, med, ci_hi, ci_lo]
-
-    return agg_stats
+def aggregate_results(df, p=0.5, alpha=0.95):
+    """ Cumulative p-quantile (the median by default) of the results of each
+    test and order, and its CI, after each run. Runs are taken from the data:
+    every run of a test and order gets one row, with its own result and the
+    statistics over all the runs up to it. The results of each test and order
+    are added run by run to a CumulativeQuantiles, so the whole table is
+    built in one pass over the data sorted once.
+    """
+    # Older results name the test column exp_command
+    command = 'test_command' if 'test_command' in df.columns else 'exp_command'
+    df = df.dropna(subset=['result'])
+    df = df.sort_values([command, 'order_type', 'run_num'], kind='stable')
+
+    rows = []
+    for idx, group in df.groupby([command, 'order_type'], sort=False, observed=True):
+        runs = group['run_num'].to_numpy()
+        results = group['result'].to_numpy(dtype=np.float64)
+        # Results of the same run (e.g. from several nodes) are added together
+        starts = np.flatnonzero(np.r_[True, runs[1:] != runs[:-1]])
+        ends = np.r_[starts[1:], len(runs)]
+        cumulative = CumulativeQuantiles(alpha=alpha)
+        for start, end in zip(starts, ends):
+            cumulative.extend(results[start:end])
+            med, ci_lo, ci_hi = cumulative.quantile_cis([p])
+            rows.append(list(idx) + [runs[start], results[start], med[0], ci_hi[0], ci_lo[0]])
+
+    return pd.DataFrame(rows, columns = [command,
+                                         'order_type',
+                                         'run_num',
+                                         'result',
+                                         'median_cmltv',
+                                         'ci_hi_cmltv',
+                                         'ci_lo_cmltv'])
 
 # TODO: Fix axes, add concise name for fig name
 def plot(df):
-    for idx, group in df.groupby(['exp_command']):
+    # Only needed for plots, which aggregating results does not require
+    from matplotlib import pyplot as plt
+    command = 'test_command' if 'test_command' in df.columns else 'exp_command'
+    for idx, group in df.groupby([command]):
         f = group[group['order_type'] == 'fixed']
         r = group[group['order_type'] == 'random']
 
@@ -78,7 +74,7 @@ def plot(df):
                          color='b', alpha=.1)
         plt.fill_between(r['run_num'], r['ci_lo_cmltv'], r['ci_hi_cmltv'],
                          color='r', alpha=.1)
-        plt.xticks(list(range(0,480,20)))
+        plt.xticks(list(range(0, int(group['run_num'].max()) + 1, 20)))
         plt.legend()
         sv = str(idx) + '_112921.pdf'
         #plt.show()
@@ -0,0 +1,90 @@
+import os
+import stat
+import hashlib
+import tarfile
+import posixpath
+
+# Never shipped to worker nodes
+EXCLUDED_NAMES = ("__pycache__",)
+
+def list_tree(sources):
+    """ Returns the sorted (local_path, archive_name) pairs of every entry
+    under 'sources', given as (local_path, archive_name) pairs.
+    """
+    entries = []
+    for local_path, arcname in sources:
+        entries.append((local_path, arcname))
+        if not os.path.isdir(local_path) or os.path.islink(local_path):
+            continue
+        for root, dirs, files in os.walk(local_path):
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_NAMES]
+            for name in dirs + [f for f in files if f not in EXCLUDED_NAMES]:
+                path = os.path.join(root, name)
+                entries.append((path, arcname + "/" + os.path.relpath(path, local_path)))
+    return sorted(entries, key=lambda entry: entry[1])
+
+def tree_digest(entries):
+    """ Returns the sha256 of the names, permissions and contents of the
+    entries returned by list_tree()
+    """
+    digest = hashlib.sha256()
+    for path, arcname in entries:
+        st = os.lstat(path)
+        digest.update(arcname.encode() + b"\0" + oct(stat.S_IMODE(st.st_mode)).encode() + b"\0")
+        if stat.S_ISLNK(st.st_mode):
+            digest.update(b"l" + os.readlink(path).encode())
+        elif stat.S_ISREG(st.st_mode):
+            digest.update(b"f" + str(st.st_size).encode() + b"\0")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(b"d")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def build_archive(sources, cache_dir):
+    """ Packs 'sources', given as (local_path, archive_name) pairs, into a
+    gzip-compressed tarball named after the hash of its content and stored in
+    'cache_dir'. An archive with the same content is only ever built once.
+    Returns (digest, archive_path).
+    """
+    entries = list_tree(sources)
+    digest = tree_digest(entries)
+    os.makedirs(cache_dir, exist_ok=True)
+    archive_path = os.path.join(cache_dir, digest + ".tar.gz")
+    if not os.path.exists(archive_path):
+        tmp_path = archive_path + "." + str(os.getpid()) + ".tmp"
+        with tarfile.open(tmp_path, "w:gz") as tar:
+            for path, arcname in entries:
+                tar.add(path, arcname=arcname, recursive=False)
+        os.replace(tmp_path, archive_path)
+    return digest, archive_path
+
+def extract_stream(fileobj, dest_dir, renames=None):
+    """ Extracts a gzip-compressed tar stream into 'dest_dir' as it is read.
+    The top-level dir of every member is replaced according to 'renames'
+    ({top-level dir: new name}, where an empty name extracts the dir's
+    content directly into 'dest_dir'). Only regular files and dirs are
+    extracted, and members that would land outside 'dest_dir' are skipped.
+    Returns the number of files extracted.
+    """
+    if renames is None:
+        renames = {}
+    n_files = 0
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        for member in tar:
+            if not (member.isfile() or member.isdir()):
+                continue
+            top, _, rest = member.name.partition("/")
+            if top in renames:
+                name = posixpath.join(renames[top], rest) if renames[top] else rest
+            else:
+                name = member.name
+            name = posixpath.normpath(name)
+            if not name or name == "." or name.startswith(("/", "..")):
+                continue
+            member.name = name
+            tar.extract(member, dest_dir)
+            n_files += member.isfile()
+    return n_files
@@ -0,0 +1,204 @@
+""" Benchmark of the overhead the controller adds to an experiment.
+
+Starts the SSH server stand-in (ssh_server.py) and runs campaigns of no-op
+tests through run_single_node/run_multiple_nodes (or, with --orchestrator
+asyncio, through AsyncOrchestrator's connections and lanes) for every
+combination of test count, node count and run count. Nodes are separate loopback
+addresses of the stand-in, so the full controller path (SSH sessions,
+environment upload, test wrapping, journals, result pulls) is exercised
+without any network or reboot latency. For each combination it reports:
+    - overhead_per_test: mean controller_duration - remote_duration (s)
+    - controller_per_test: mean controller_duration (s)
+    - throughput: tests completed per second of wall time
+    - cpu_per_test: controller process CPU time per test (s)
+    - max_rss_mb: peak resident memory of the controller process
+
+Usage: python benchmarks/controller_overhead.py --tests 1,10,50 --nodes 1,4 --runs 1,3
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import socket
+import asyncio
+import getpass
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import paramiko
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+import controller
+from allocation import Allocation
+from journal import read_journal
+
+REPO_NAME = "bench_repo"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the controller's overhead per test, run and node")
+    parser.add_argument("--tests", type=str, default="1,10,50",
+                        help="Comma-separated numbers of tests per run")
+    parser.add_argument("--nodes", type=str, default="1,4",
+                        help="Comma-separated numbers of worker nodes")
+    parser.add_argument("--runs", type=str, default="1,3",
+                        help="Comma-separated numbers of runs per order (config.n_runs)")
+    parser.add_argument("--agent", action="store_true",
+                        help="Run tests with the runner agent (config.use_agent)")
+    parser.add_argument("--orchestrator", type=str, default="threads",
+                        choices=["threads", "asyncio"],
+                        help="Run the nodes with threads or with AsyncOrchestrator")
+    parser.add_argument("--csv", type=str, default=None,
+                        help="Also save the report to this csv file")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Keep the controller's console output")
+    return parser.parse_args()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(root, port, n_nodes, public_key_file):
+    proc = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "ssh_server.py"),
+                             "--port", str(port), "--root", root, "--nodes", str(n_nodes),
+                             "--authorized-key", public_key_file],
+                            stdout=subprocess.PIPE)
+    # Wait until the server listens
+    proc.stdout.readline()
+    return proc
+
+def prepare_homes(root, hostnames):
+    """ Recreates the home dir of every node, with what initialization
+    would have deployed: the experiment repo, the runner and results_dir
+    """
+    for host in hostnames:
+        home = os.path.join(root, host)
+        shutil.rmtree(home, ignore_errors=True)
+        os.makedirs(os.path.join(home, REPO_NAME))
+        os.makedirs(os.path.join(home, "results"))
+        shutil.copytree(controller.RUNNER_DIR, os.path.join(home, "runner"))
+
+def configure(port, n_runs, use_agent):
+    config.backend = "ssh"
+    config.port_num = port
+    config.repo = REPO_NAME
+    config.results_dir = "~/results"
+    config.results_file = "results.txt"
+    config.n_runs = n_runs
+    config.seed = 1
+    config.reset = False
+    config.scheduling = "replicated"
+    config.adaptive = False
+    config.pull_results_dir = False
+    config.incremental_pull = False
+    config.use_agent = use_agent
+    config.instrumentation_modules = []
+
+async def run_async(allocation, results_dir, plan, lanes):
+    """ Connects every node through AsyncOrchestrator and runs their lanes,
+    skipping initialization as the other path does
+    """
+    orchestrator = controller.AsyncOrchestrator(allocation, results_dir, plan["timestamp"],
+                                                plan=plan)
+    orchestrator.create_limits()
+    sessions = await asyncio.gather(*(orchestrator.connect(h, orchestrator.node_log(h))
+                                      for h in lanes))
+    orchestrator.sessions = dict(zip(lanes, sessions))
+    orchestrator.monitor = controller.make_monitor(plan)
+    failed = await orchestrator.run_lanes(lanes)
+    orchestrator.executor.shutdown()
+    if failed:
+        raise RuntimeError("Experimentation failed on " + ", ".join(failed))
+
+def run_point(work_dir, homes, allocation, n_tests, n_nodes, n_runs, orchestrator="threads"):
+    hostnames = ["127.0.0." + str(i + 1) for i in range(n_nodes)]
+    allocation.hostnames = list(hostnames)
+    prepare_homes(homes, hostnames)
+    timestamp = "bench_" + str(n_tests) + "_" + str(n_nodes) + "_" + str(n_runs)
+    results_dir = os.path.join(work_dir, timestamp)
+    os.makedirs(results_dir)
+    tests = ["echo " + str(i) + " >> $HOME/results/results.txt" for i in range(n_tests)]
+    plan = controller.make_plan(tests, hostnames, timestamp)
+    lanes = {host: host for host in hostnames}
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if orchestrator == "asyncio":
+        asyncio.run(run_async(allocation, results_dir, plan, lanes))
+    elif n_nodes == 1:
+        controller.run_single_node(hostnames[0], allocation, results_dir, plan, hostnames[0])
+    else:
+        controller.run_multiple_nodes(allocation, results_dir, plan, lanes)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    records = [r for path in glob.glob(controller.journal_path(results_dir, "*", "test"))
+               for r in read_journal(path)]
+    df = pd.DataFrame(records, columns=controller.TEST_RESULT_COLUMNS)
+    n_done = len(df)
+    failures = int((df["completion_status"] != "Success").sum())
+    overhead = (df["controller_duration"] - df["remote_duration"]).mean()
+    return {"n_tests": n_tests, "n_nodes": n_nodes, "n_runs": n_runs,
+            "tests_run": n_done, "failures": failures,
+            "wall_time": wall,
+            "overhead_per_test": overhead,
+            "controller_per_test": df["controller_duration"].mean(),
+            "throughput": n_done / wall if wall else float("nan"),
+            "cpu_per_test": cpu / n_done if n_done else float("nan"),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def main():
+    args = parse_args()
+    if not args.verbose:
+        for handler in controller.LOG.handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp(prefix="ordersage_bench_")
+    homes = os.path.join(work_dir, "homes")
+    os.makedirs(homes)
+    # The stand-in only lets this key in
+    key_file = os.path.join(work_dir, "id_rsa")
+    key = paramiko.RSAKey.generate(2048)
+    key.write_private_key_file(key_file)
+    with open(key_file + ".pub", "w") as f:
+        f.write(key.get_name() + " " + key.get_base64() + "\n")
+    port = free_port()
+    node_counts = [int(x) for x in args.nodes.split(",")]
+    server = start_server(homes, port, max(node_counts), key_file + ".pub")
+    # Per-node log files of the controller are written to the cwd
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    rows = []
+    try:
+        allocation = Allocation([], user=getpass.getuser(), public_key=key_file)
+        for n_runs in [int(x) for x in args.runs.split(",")]:
+            configure(port, n_runs, args.agent)
+            for n_nodes in node_counts:
+                for n_tests in [int(x) for x in args.tests.split(",")]:
+                    rows.append(run_point(work_dir, homes, allocation, n_tests, n_nodes, n_runs,
+                                          orchestrator=args.orchestrator))
+                    print(pd.DataFrame(rows[-1:]).to_string(index=False, header=len(rows) == 1),
+                          flush=True)
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = pd.DataFrame(rows)
+    print()
+    print(report.to_string(index=False))
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+
+if __name__ == "__main__":
+    sys.exit(main())
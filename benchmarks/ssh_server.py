@@ -0,0 +1,223 @@
+""" Local SSH server stand-in for the controller benchmarks.
+
+Serves exec and SFTP requests with paramiko. Since it runs any command it
+is sent, it only listens on loopback addresses, drops connections that do
+not come from loopback, and only accepts the public key given with
+--authorized-key (no password authentication).
+Each of the --nodes loopback addresses it listens on (127.0.0.1, 127.0.0.2,
+...) acts as a separate worker node whose home directory is
+<root>/<address>: commands run there with /bin/bash and $HOME set to it.
+Nothing is ever rebooted, so benchmarks must run with config.reset = False.
+
+Usage: python ssh_server.py --port 2222 --root /tmp/ordersage_bench --nodes 4 --authorized-key id_rsa.pub
+"""
+import os
+import sys
+import base64
+import socket
+import argparse
+import ipaddress
+import threading
+import subprocess
+
+import paramiko
+
+class StandInServer(paramiko.ServerInterface):
+    def __init__(self, home, authorized_key):
+        self.home = home
+        self.authorized_key = authorized_key
+        self.commands = {}
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        if key == self.authorized_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=run_command, args=(channel, command, self.home),
+                         daemon=True).start()
+        return True
+
+def pump(src, dst):
+    """ Copies a process' output to the channel until EOF """
+    for chunk in iter(lambda: src.read1(32768), b""):
+        dst(chunk)
+
+def run_command(channel, command, home):
+    proc = subprocess.Popen(command.decode(), shell=True, executable="/bin/bash",
+                            cwd=home, env=dict(os.environ, HOME=home),
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+
+    def feed_stdin():
+        try:
+            for chunk in iter(lambda: channel.recv(32768), b""):
+                proc.stdin.write(chunk)
+                proc.stdin.flush()
+        except (OSError, EOFError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    threading.Thread(target=feed_stdin, daemon=True).start()
+    stderr = threading.Thread(target=pump, args=(proc.stderr, channel.sendall_stderr),
+                              daemon=True)
+    stderr.start()
+    pump(proc.stdout, channel.sendall)
+    stderr.join()
+    channel.send_exit_status(proc.wait())
+    channel.shutdown_write()
+    channel.close()
+
+class StandInSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+class StandInSFTP(paramiko.SFTPServerInterface):
+    """ SFTP access to the worker's home directory """
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.home = server.home
+
+    def _path(self, path):
+        path = path.decode() if isinstance(path, bytes) else path
+        if path.startswith("~/"):
+            path = path[2:]
+        return os.path.join(self.home, path.lstrip("/"))
+
+    def open(self, path, flags, attr):
+        path = self._path(path)
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = StandInSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        path = self._path(path)
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, f)), f)
+                    for f in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+def load_public_key(path):
+    """ RSA key of an OpenSSH public key file ("ssh-rsa AAAA... comment") """
+    with open(path) as f:
+        fields = f.read().split()
+    return paramiko.RSAKey(data=base64.b64decode(fields[1]))
+
+def serve_connection(sock, host_key, root, authorized_key):
+    if not ipaddress.ip_address(sock.getpeername()[0]).is_loopback:
+        sock.close()
+        return
+    # Small packets must not wait for delayed ACKs, or every command would
+    # pay ~40ms that a real sshd does not add
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    home = os.path.join(root, sock.getsockname()[0])
+    os.makedirs(home, exist_ok=True)
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(host_key)
+    transport.set_subsystem_handler("sftp", paramiko.SFTPServer, StandInSFTP)
+    server = StandInServer(home, authorized_key)
+    try:
+        transport.start_server(server=server)
+    except (paramiko.SSHException, EOFError):
+        return
+    # Channels are served by the transport's own thread
+    transport.join()
+
+def node_addresses(n_nodes):
+    """ Loopback addresses of the first n_nodes worker nodes """
+    return ["127.0.0." + str(i + 1) for i in range(n_nodes)]
+
+def accept(listener, host_key, root, authorized_key):
+    while True:
+        sock, _ = listener.accept()
+        threading.Thread(target=serve_connection, args=(sock, host_key, root, authorized_key),
+                         daemon=True).start()
+
+def serve(port, root, authorized_key, n_nodes=1, host_key=None, ready=None):
+    if host_key is None:
+        host_key = paramiko.RSAKey.generate(2048)
+    listeners = []
+    for address in node_addresses(n_nodes):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((address, port))
+        listener.listen(128)
+        listeners.append(listener)
+    if ready is not None:
+        ready()
+    threads = [threading.Thread(target=accept, args=(listener, host_key, root, authorized_key),
+                                daemon=True) for listener in listeners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="SSH server stand-in for ordersage benchmarks")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--root", type=str, required=True,
+                        help="Directory holding the home directory of every worker")
+    parser.add_argument("--nodes", type=int, default=1,
+                        help="Number of worker nodes, served on 127.0.0.1 to 127.0.0.<nodes>")
+    parser.add_argument("--authorized-key", type=str, required=True,
+                        help="OpenSSH public key file of the only key allowed to log in")
+    args = parser.parse_args()
+    serve(args.port, os.path.abspath(args.root), load_public_key(args.authorized_key),
+          n_nodes=args.nodes,
+          ready=lambda: print("listening on " + str(args.port), flush=True))
+
+if __name__ == "__main__":
+    sys.exit(main())
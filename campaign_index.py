@@ -0,0 +1,290 @@
+""" Local index of the results of every campaign, for queries across campaigns.
+
+Each campaign's results directory (<timestamp>_results) is loaded once into
+a SQLite database: its runs, tests, the environment of every node and the
+rows of its stats outputs. Tests, runs and environments are indexed by test
+command, hostname and hardware, so the history of a test across all indexed
+campaigns is a single indexed query.
+
+Usage:
+    python campaign_index.py index <results_dir> [<results_dir> ...]
+    python campaign_index.py list
+    python campaign_index.py history "<test command>" [--hostname H] [--cpu-model M] [--raw]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import argparse
+
+import pandas as pd
+
+from results_io import FORMATS, load_table
+
+LOG = logging.getLogger("main")
+
+DEFAULT_DB = "campaign_index.db"
+
+TEST_COLUMNS = ["run_uuid", "hostname", "run_num", "total_runs", "test_command",
+                "test_number", "order_number", "order_type", "time_start", "time_stop",
+                "completion_status", "result", "result_raw", "controller_duration",
+                "remote_duration"]
+RUN_COLUMNS = ["run_uuid", "hostname", "run_num", "total_runs", "order_type",
+               "random_seed", "time_start", "time_stop", "reset_latency"]
+ENV_COLUMNS = ["nodeid", "nodeuuid", "arch", "ver_hash", "gcc_ver", "total_mem",
+               "mem_clock_speed", "nthreads", "nsockets", "cpu_model", "kernel_release",
+               "os_release"]
+# Environment fields identifying a node's hardware
+HARDWARE_COLUMNS = ["arch", "cpu_model", "nthreads", "nsockets", "total_mem", "mem_clock_speed"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    campaign TEXT PRIMARY KEY,
+    results_dir TEXT,
+    indexed_at REAL,
+    n_runs INTEGER,
+    n_tests INTEGER
+);
+CREATE TABLE IF NOT EXISTS runs (
+    campaign TEXT, run_uuid TEXT, hostname TEXT, run_num INTEGER, total_runs INTEGER,
+    order_type TEXT, random_seed REAL, time_start REAL, time_stop REAL, reset_latency REAL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    campaign TEXT, run_uuid TEXT, hostname TEXT, run_num INTEGER, total_runs INTEGER,
+    test_command TEXT, test_number INTEGER, order_number INTEGER, order_type TEXT,
+    time_start REAL, time_stop REAL, completion_status TEXT, result REAL, result_raw TEXT,
+    controller_duration REAL, remote_duration REAL,
+    measures TEXT
+);
+CREATE TABLE IF NOT EXISTS envs (
+    campaign TEXT, hostname TEXT, nodeid TEXT, nodeuuid TEXT, arch TEXT, ver_hash TEXT,
+    gcc_ver TEXT, total_mem TEXT, mem_clock_speed TEXT, nthreads INTEGER, nsockets INTEGER,
+    cpu_model TEXT, kernel_release TEXT, os_release TEXT,
+    hardware TEXT
+);
+CREATE TABLE IF NOT EXISTS stats (
+    campaign TEXT, output TEXT, test_command TEXT, hostname TEXT, data TEXT
+);
+CREATE INDEX IF NOT EXISTS tests_command ON tests (test_command, campaign);
+CREATE INDEX IF NOT EXISTS tests_hostname ON tests (hostname);
+CREATE INDEX IF NOT EXISTS tests_campaign ON tests (campaign);
+CREATE INDEX IF NOT EXISTS runs_campaign ON runs (campaign);
+CREATE INDEX IF NOT EXISTS runs_hostname ON runs (hostname);
+CREATE INDEX IF NOT EXISTS envs_host ON envs (campaign, hostname);
+CREATE INDEX IF NOT EXISTS envs_hardware ON envs (hardware);
+CREATE INDEX IF NOT EXISTS envs_cpu_model ON envs (cpu_model);
+CREATE INDEX IF NOT EXISTS stats_command ON stats (test_command, campaign);
+"""
+
+def connect(db_path=DEFAULT_DB):
+    """ Opens the index, creating its tables and indexes if needed """
+    conn = sqlite3.connect(os.path.expanduser(db_path))
+    conn.executescript(SCHEMA)
+    return conn
+
+def hardware_fingerprint(env):
+    """ Short hash of the hardware fields of an environment record, equal
+    for nodes of the same hardware type
+    """
+    key = "|".join(str(env.get(c, "")) for c in HARDWARE_COLUMNS)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def to_rows(df, columns):
+    """ Values of 'columns' of 'df' as tuples, with missing values as NULL """
+    df = df.reindex(columns=columns).astype(object)
+    df = df.where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def find_table(results_dir, name):
+    """ Path of a combined results table of a campaign, in any format """
+    for ext in FORMATS.values():
+        found = glob.glob(os.path.join(results_dir, "*_all_" + name + ext))
+        if found:
+            return found[0]
+    return None
+
+def campaign_name(tests_path):
+    """ A campaign is identified by the timestamp its tables are prefixed with """
+    return os.path.basename(tests_path).split("_all_test_results")[0]
+
+def load_envs(results_dir, campaign):
+    """ Environment records of every node, from the per-node env_out files """
+    rows = []
+    for path in sorted(glob.glob(os.path.join(results_dir, "*_env_out.csv"))):
+        hostname = os.path.basename(path)[:-len("_env_out.csv")]
+        if hostname == campaign + "_all":
+            continue
+        try:
+            env = pd.read_csv(path, dtype=str)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            LOG.warning("Skipping unreadable environment file " + path + ": " + str(e))
+            continue
+        for record in env.to_dict("records"):
+            record = {k: v for k, v in record.items() if pd.notna(v)}
+            rows.append((campaign, hostname) +
+                        tuple(record.get(c) for c in ENV_COLUMNS) +
+                        (hardware_fingerprint(record),))
+    return rows
+
+def load_stats(results_dir, campaign):
+    """ Rows of the stats outputs of a campaign, stored as JSON """
+    rows = []
+    for path in sorted(glob.glob(os.path.join(results_dir, campaign + "_*stats*.csv"))):
+        output = os.path.basename(path)[len(campaign) + 1:-len(".csv")]
+        df = pd.read_csv(path)
+        for record in df.to_dict("records"):
+            record = {k: (None if pd.isna(v) else v) for k, v in record.items()
+                      if not isinstance(v, (list, dict))}
+            rows.append((campaign, output, record.get("test_command"), record.get("hostname"),
+                         json.dumps(record, default=str)))
+    return rows
+
+def index_campaign(results_dir, db_path=DEFAULT_DB, log=None):
+    """ Adds the results of the campaign in 'results_dir' to the index,
+    replacing what was indexed for it before. Returns the campaign name.
+    """
+    if log is None:
+        log = LOG
+    results_dir = os.path.abspath(results_dir.rstrip("/"))
+    tests_path = find_table(results_dir, "test_results")
+    if tests_path is None:
+        raise FileNotFoundError("No combined test results in " + results_dir)
+    campaign = campaign_name(tests_path)
+    tests = load_table(tests_path, kind="test")
+    runs_path = find_table(results_dir, "run_results")
+    runs = load_table(runs_path, kind="run") if runs_path else pd.DataFrame(columns=RUN_COLUMNS)
+
+    # Per-test measures of instrumentation modules are kept as JSON
+    extra = [c for c in tests.columns if c not in TEST_COLUMNS]
+    test_rows = to_rows(tests, TEST_COLUMNS)
+    if extra:
+        measures = [json.dumps({k: v for k, v in r.items() if pd.notna(v)}, default=str)
+                    for r in tests[extra].to_dict("records")]
+    else:
+        measures = [None] * len(tests)
+    test_rows = [(campaign,) + r + (m,) for r, m in zip(test_rows, measures)]
+    run_rows = [(campaign,) + r for r in to_rows(runs, RUN_COLUMNS)]
+    env_rows = load_envs(results_dir, campaign)
+    stats_rows = load_stats(results_dir, campaign)
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            for table in ["tests", "runs", "envs", "stats", "campaigns"]:
+                conn.execute("DELETE FROM " + table + " WHERE campaign = ?", (campaign,))
+            conn.execute("INSERT INTO campaigns VALUES (?, ?, ?, ?, ?)",
+                         (campaign, results_dir, time.time(), len(runs), len(tests)))
+            conn.executemany("INSERT INTO tests VALUES (" + ",".join("?" * (len(TEST_COLUMNS) + 2)) + ")",
+                             test_rows)
+            conn.executemany("INSERT INTO runs VALUES (" + ",".join("?" * (len(RUN_COLUMNS) + 1)) + ")",
+                             run_rows)
+            conn.executemany("INSERT INTO envs VALUES (" + ",".join("?" * (len(ENV_COLUMNS) + 3)) + ")",
+                             env_rows)
+            conn.executemany("INSERT INTO stats VALUES (?, ?, ?, ?, ?)", stats_rows)
+    finally:
+        conn.close()
+    log.info("Indexed campaign " + campaign + " (" + str(len(tests)) + " tests, "
+             + str(len(runs)) + " runs) in " + db_path)
+    return campaign
+
+def list_campaigns(db_path=DEFAULT_DB):
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query("SELECT campaign, results_dir, n_runs, n_tests, "
+                                 "datetime(indexed_at, 'unixepoch') AS indexed_at "
+                                 "FROM campaigns ORDER BY campaign", conn)
+    finally:
+        conn.close()
+
+def test_history(test_command, db_path=DEFAULT_DB, hostname=None, cpu_model=None,
+                 hardware=None, raw=False):
+    """ Results of 'test_command' in every indexed campaign, optionally
+    restricted to a node or to a hardware type (CPU model or fingerprint).
+    Returns one row per campaign, node and order type with summary
+    statistics of the successful results, or every test if 'raw' is set.
+    """
+    where = ["t.test_command = ?"]
+    params = [test_command]
+    if hostname is not None:
+        where.append("t.hostname = ?")
+        params.append(hostname)
+    if cpu_model is not None:
+        where.append("e.cpu_model = ?")
+        params.append(cpu_model)
+    if hardware is not None:
+        where.append("e.hardware = ?")
+        params.append(hardware)
+    source = ("FROM tests t LEFT JOIN envs e "
+              "ON e.campaign = t.campaign AND e.hostname = t.hostname "
+              "WHERE " + " AND ".join(where))
+    if raw:
+        query = ("SELECT t.campaign, t.hostname, e.cpu_model, e.hardware, t.run_uuid, "
+                 "t.run_num, t.order_type, t.order_number, t.completion_status, t.result, "
+                 "t.result_raw, t.time_start " + source +
+                 " ORDER BY t.campaign, t.hostname, t.time_start")
+    else:
+        query = ("SELECT t.campaign, t.hostname, e.cpu_model, e.hardware, t.order_type, "
+                 "COUNT(*) AS n_tests, "
+                 "SUM(t.completion_status != 'Success') AS n_failures, "
+                 "AVG(CASE WHEN t.completion_status = 'Success' THEN t.result END) AS mean_result, "
+                 "MIN(CASE WHEN t.completion_status = 'Success' THEN t.result END) AS min_result, "
+                 "MAX(CASE WHEN t.completion_status = 'Success' THEN t.result END) AS max_result "
+                 + source +
+                 " GROUP BY t.campaign, t.hostname, t.order_type"
+                 " ORDER BY t.campaign, t.hostname, t.order_type")
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Index campaign results and query them across campaigns")
+    parser.add_argument("--db", type=str, default=DEFAULT_DB,
+                        help="Path of the index database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="Add campaign results directories to the index")
+    index.add_argument("results_dirs", nargs="+", help="<timestamp>_results directories")
+
+    commands.add_parser("list", help="List the indexed campaigns")
+
+    history = commands.add_parser("history", help="Results of one test across campaigns")
+    history.add_argument("test_command", type=str)
+    history.add_argument("--hostname", type=str, default=None)
+    history.add_argument("--cpu-model", type=str, default=None)
+    history.add_argument("--hardware", type=str, default=None,
+                         help="Hardware fingerprint of the nodes (see the envs table)")
+    history.add_argument("--raw", action="store_true",
+                         help="Print every test instead of a summary per campaign")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "index":
+        for results_dir in args.results_dirs:
+            try:
+                index_campaign(results_dir, db_path=args.db)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                LOG.error("Could not index " + results_dir + ": " + str(e))
+        return 0
+    if args.command == "list":
+        df = list_campaigns(args.db)
+    else:
+        start = time.perf_counter()
+        df = test_history(args.test_command, db_path=args.db, hostname=args.hostname,
+                          cpu_model=args.cpu_model, hardware=args.hardware, raw=args.raw)
+        LOG.info("Query took " + str(round((time.perf_counter() - start) * 1000, 1)) + " ms")
+    if df.empty:
+        print("Nothing found")
+    else:
+        print(df.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,11 +6,21 @@ workers = ["hostname"]
 user = "user"
 keyfile = "~/.ssh/id_ed25519"
 port_num = 22
+# "ssh" reaches workers over SSH. "local" runs each worker in a directory of
+# this machine (no network, no reboots): workers are either existing dirs
+# (e.g. the root of a container) or names of dirs created under local_root.
+# Local workers are not isolated: commands run on this machine, so
+# init_script_call, env_info.sh and instrumentation modules are not run with
+# the local backend
+backend = "ssh"
+local_root = "~/.ordersage/local"
 
 """
 Experiemnt Repo
 """
 repo = "https://gitlab.flux.utah.edu/carina/test-experiments.git"
+# Local cache of experiment archives (and of the clone of a git repo)
+archive_cache_dir = "~/.ordersage"
 
 """
 Filepaths and commands on worker node
@@ -19,6 +29,12 @@ init_script_call = "cd test-experiments && bash initialize.sh"
 exp_script_call = "cd test-experiments && python3 exp_config.py"
 results_dir = "~/test-experiments/results"
 results_file = "results.txt"
+# Results are captured as each test finishes. Set to True to also copy the
+# worker's whole results_dir at the end (e.g. for extra files tests write there)
+pull_results_dir = False
+# Pull new result files (e.g. perf outputs) after every run instead of all at
+# the end, so that the final pull of each node only transfers its last run
+incremental_pull = False
 
 """
 Controller options
@@ -31,8 +47,81 @@ interleave = True
 verbose = True
 # Ignore reset command for debugging purposes
 reset = False
+# Give up on a rebooting node after this many seconds
+reset_timeout = 600
+# Initial and maximum delay (seconds) between reboot-completion polls
+reset_poll_interval = 1
+reset_poll_max_interval = 10
 # Set your own random seed
 seed = None
+# "replicated" runs the full campaign on every node, "pooled" shares the
+# 2 * n_runs runs between all nodes, each node pulling the next run when free
+scheduling = "replicated"
+
+# Columns of the test results compared between fixed and random orders, e.g.
+# "perf.cycles" for a counter of the perf module
+stats_measures = ["result"]
+
+# Processes running the per-configuration tests of the analysis (0 for one
+# per CPU). Worth raising for campaigns with thousands of configurations.
+stats_jobs = 1
+
+# Tail quantiles whose CIs are compared between orders along with the median
+stats_tail_quantiles = [0.9, 0.99]
+
+# Names of the values of tests whose result holds several comma-separated
+# values, by a substring of their test command. Values written as name=value
+# are named by the test itself.
+result_names = {"run_memory": ["copy_omp", "scale_omp", "add_omp", "triad_omp"]}
+
+"""
+Adaptive early stopping options
+"""
+# Stop the campaign before n_runs once every test has converged. n_runs is
+# then the maximum number of runs per order
+adaptive = False
+# A test converges once its fixed and random median CIs are narrower than
+# this fraction of the median...
+adaptive_rel_ci_width = 0.02
+# ...or once its CI overlap case and KW outcome stay the same this many runs
+adaptive_stable_evals = 5
+# Minimum number of fixed and of random results before a test is evaluated.
+# Each value of a multi-value result (see result_names) converges on its own;
+# tests with no numeric result after this many runs do not hold up stopping
+adaptive_min_runs = 10
+
+"""
+Orchestration options
+"""
+# "threads" starts one thread per node, "asyncio" drives every node from a
+# single event loop (recommended for large allocations)
+orchestrator = "threads"
+# Start the runs of each node as soon as that node is initialized instead of
+# waiting for the whole allocation. The test commands are retrieved from the
+# first node that is ready
+pipelined = False
+# Hand each run to a small agent on the worker (runner/agent.py) that runs its
+# tests back to back, instead of one remote command per test. Recommended for
+# short tests, where the per-command overhead is significant. Requires python3
+# on the worker
+use_agent = False
+# Limits on concurrent operations across all nodes (asyncio orchestrator)
+max_concurrent_connects = 32
+max_concurrent_reboots = 16
+max_concurrent_transfers = 8
+
+"""
+Result journal and storage options
+"""
+# "csv", or "parquet" (requires pyarrow) for typed columnar result tables
+# that are much faster to load for analysis
+results_format = "csv"
+# SQLite index of all campaigns (see campaign_index.py), updated at the end
+# of every campaign. Set to None to disable.
+campaign_index = "campaign_index.db"
+# Test records are forced to disk every N records or T seconds, and after each run
+journal_sync_every = 20
+journal_sync_interval = 10
 
 """
 Instrumentation options, in the order they need to be added to the experiment
@@ -4,11 +4,15 @@ import os
 import subprocess
 import argparse
 import io
-from contextlib import redirect_stdout
+from contextlib import redirect_stdout, nullcontext
 from pathlib import Path
 import glob
 from functools import partial
 import shlex
+import posixpath
+import json
+import hashlib
+import sqlite3
 
 # Time libraries and RNG
 import time
@@ -18,17 +22,17 @@ from timeit import default_timer as timer
 import random
 
 # SSH libraries
-import paramiko
-from scp import SCPClient
+from session import WorkerSession, LocalSession
 
 # error handling and logging
 import logging
 from logger import configure_logging
 
 # Subprocess functions
-from subprocess import PIPE, STDOUT, run
+from subprocess import PIPE, STDOUT
 
 # dataframe libraries and stats
+import numpy as np
 import pandas as pd
 from statistics import mean
 
@@ -37,22 +41,33 @@ import uuid
 
 # multithreading
 import threading
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # files from tool repo
 import config
 from allocation import Allocation
+from journal import ResultJournal, read_journal
+from archive import build_archive, extract_stream
+from results_io import FORMATS, resolve_format, apply_schema, save_table, load_table, \
+    value_names
 from toolstats import run_stats
+from convergence import ConvergenceMonitor
+from campaign_index import index_campaign
 
 # Config file parsing
 from configparser import ConfigParser
 
 # Instrumentation
-from instrumentation.configure import configure_instr_module, setup_env_file, pull_results
+from instrumentation.configure import configure_instr_module, setup_env_file, \
+    env_exports, results_location, load_results
 
 TOOL_BASE_DIR = os.path.dirname(__file__)
 INSTRUMENTATION_SCRIPTS_DIR = os.path.join(TOOL_BASE_DIR, 'instrumentation')
-
-ENVIRONMENT_DICT = {}
+RUNNER_DIR = os.path.join(TOOL_BASE_DIR, 'runner')
+# Deployment state kept in the home dir of worker nodes
+REMOTE_CACHE_DIR = ".ordersage"
 
 class ThreadWithReturn(threading.Thread):
     def run(self):
@@ -89,54 +104,49 @@ def parse_args():
                         help='Switch to allowing running experiments on CloudLab es')
     parser.add_argument('--cloudlab_config', type=str, default='cloudlab.config',
                         help='Path to config file with CloudLab-related settings')
+    parser.add_argument('--resume', type=str, default=None, metavar='RESULTS_DIR',
+                        help='Resume an interrupted campaign from its results directory')
     return parser.parse_args()
 
 ################################
 ### Establish SSH Connection ###
 ################################
-def open_ssh_connection(worker, allocation, log=None, port_num=22, timeout = 25,max_tries=10):
-    """ Attemps to establish an SSH connection to the specified worker node.
-    If successful, returns an SSHClient with open connection to the worker.
+def open_session(worker, allocation, log=None, port_num=None, timeout = 25,max_tries=10):
+    """ Attemps to establish a session to the specified worker node through
+    the backend selected by config.backend: a WorkerSession with an open SSH
+    connection ("ssh"), or a LocalSession ("local"). The SSH session
+    reconnects on its own if the connection is lost (e.g. after a reboot), so
+    callers should keep and reuse it for the lifetime of the worker.
     """
     if log is None:
         log = LOG
-    log.info("Starting ssh connection to " + worker)
-    n_tries = 0
-    ssh = paramiko.SSHClient()
-    ssh.load_system_host_keys()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    # SSH Connect
-    while True:
-        try:
-            ssh.connect(hostname = worker, port = port_num,
-                        username = allocation.user,
-                        key_filename = allocation.public_key,
-                        timeout = timeout)
-        except Exception as e:
-            n_tries += 1
-            log.error("In open_ssh_connection: " + repr(e) + " - " + str(e))
-            log.info("Error #" + str(n_tries) + " of " + str(max_tries) + ".")
-            if n_tries >= max_tries:
-                log.error("Failure to connect to " + worker)
-                log.error(e)
-                raise
-            else:
-                log.info("Retrying...")
-                sleep(timeout)
-        else:
-            log.info("SSH connection to " + worker + " successful.")
-            return ssh
+    if port_num is None:
+        port_num = config.port_num
+    if config.backend == "local":
+        session = LocalSession(worker, allocation, log=log, root=config.local_root)
+    else:
+        session = WorkerSession(worker, allocation, log=log, port_num=port_num,
+                                timeout=timeout, max_tries=max_tries)
+    return session.connect()
 
 ######################################
 ### Execute command on worker node ###
 ######################################
-def execute_remote_command(ssh_client, cmd, max_tries=5, timeout=10,
+class RemoteCommandError(RuntimeError):
+    """ Raised when a remote command exits with a non-zero status. Carries
+    the command's output, which may still contain results.
+    """
+    def __init__(self, cmd, exit_status, output):
+        super().__init__("'" + cmd + "' exited with status " + str(exit_status))
+        self.exit_status = exit_status
+        self.output = output
+
+def execute_remote_command(session, cmd, max_tries=5, timeout=10,
                             print_to_console=False, log=None, test = False):
-    """ Executes command on worker node via pre-established SSHClient.
+    """ Executes command on worker node via pre-established WorkerSession.
     Captures stdout continuously as command runs and blocks until remote command
     finishes execution and exit status is received. If verbose option is on, stdout
-    will print to terminal.
+    will print to terminal. Returns the combined stdout and stderr of the command.
     """
     n_tries = 0
     if log is None:
@@ -144,17 +154,18 @@ def execute_remote_command(ssh_client, cmd, max_tries=5, timeout=10,
 
     while True:
         try:
-            # Open channel and execute command
-            transport = ssh_client.get_transport()
-            channel = transport.open_session()
+            # Open channel on the shared transport and execute command
+            channel = session.open_channel()
             channel.set_combine_stderr(True)
             channel.exec_command(cmd)
+            captured = []
             while True:
                 output = channel.recv(1024)
                 if not output:
                     break
                 else:
                     out = output.decode('utf-8')
+                    captured.append(out)
                     if print_to_console:
                         print(out)
                     else:
@@ -176,13 +187,123 @@ def execute_remote_command(ssh_client, cmd, max_tries=5, timeout=10,
         else:
             # Blocks until command finishes execution
             exit_status = channel.recv_exit_status()
+            channel.close()
             # Handles errors on remote side
             if exit_status != 0:
                 log.error("Error executing command: '" + cmd
                             + "'. Exit status: " + str(exit_status))
-                raise
-            channel.close()
-            return
+                raise RemoteCommandError(cmd, exit_status, "".join(captured))
+            return "".join(captured)
+
+def stream_to_remote(session, local_path, cmd, log=None, chunk_size=1 << 20):
+    """ Streams a local file to the stdin of 'cmd' on the worker node over a
+    channel of the session's transport, and returns once 'cmd' exits.
+    """
+    if log is None:
+        log = LOG
+    channel = session.open_channel()
+    try:
+        channel.set_combine_stderr(True)
+        channel.exec_command(cmd)
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                channel.sendall(chunk)
+        channel.shutdown_write()
+        output = []
+        while True:
+            out = channel.recv(1024)
+            if not out:
+                break
+            output.append(out.decode('utf-8', errors='replace'))
+        exit_status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    if exit_status != 0:
+        log.error("Error executing command: '" + cmd + "'. Exit status: " + str(exit_status))
+        raise RemoteCommandError(cmd, exit_status, "".join(output))
+
+def remote_path(path):
+    """ Returns 'path' as a double-quoted shell word, with a leading ~
+    expanded through $HOME
+    """
+    if path == "~" or path.startswith("~/"):
+        path = "$HOME" + path[1:]
+    return "\"" + path + "\""
+
+def pull_tree(session, sources, local_dir, incremental=False, exclude=None, log=None):
+    """ Pulls remote files into 'local_dir' as a single compressed tar stream
+    over a channel of the session's transport, extracting the files as they
+    arrive. 'sources' is a list of (remote_path, local_name) pairs: the
+    remote dir is saved as 'local_name', or its content is extracted directly
+    into 'local_dir' if 'local_name' is empty. With 'incremental', only files
+    modified since the last successful pull from this node are sent. Files
+    named in 'exclude' are skipped. Returns the number of files pulled.
+    """
+    if log is None:
+        log = LOG
+    stamp = "$HOME/" + REMOTE_CACHE_DIR + "/pull_stamp"
+    newer = ""
+    if incremental:
+        # Everything is pulled if nothing has been pulled from this node yet
+        newer = " $(test -e " + stamp + " && echo -newer " + stamp + ")"
+    for name in exclude or []:
+        newer += " ! -name " + shlex.quote(name)
+    script = "mkdir -p $HOME/" + REMOTE_CACHE_DIR + " && touch " + stamp + ".new && L=$(mktemp) && "
+    for path, _ in sources:
+        path = remote_path(path.rstrip("/"))
+        # GNU tar reads "-C dir" lines in its file list
+        script += ("if [ -d " + path + " ]; then d=$(cd " + path + "/.. && pwd); "
+                   + "echo \"-C $d\" >> $L; (cd \"$d\" && find $(basename " + path + ")"
+                   + newer + " -type f) >> $L; fi; ")
+    script += "tar czf - --no-recursion -T $L; rc=$?; rm -f $L; exit $rc"
+
+    renames = {posixpath.basename(path.rstrip("/")): name for path, name in sources}
+    channel = session.open_channel()
+    try:
+        channel.exec_command("/bin/bash -c " + shlex.quote(script))
+        n_files = extract_stream(channel.makefile("rb"), local_dir, renames)
+        errors = channel.makefile_stderr("rb").read().decode('utf-8', errors='replace')
+        exit_status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    if exit_status != 0:
+        log.error("Failed to pull " + ", ".join(p for p, _ in sources) + " from "
+                  + session.worker + ": " + errors)
+        raise RemoteCommandError("pull_tree", exit_status, errors)
+    # Only move the stamp once the files are safely extracted
+    execute_remote_command(session, "mv " + stamp + ".new " + stamp, log=log)
+    log.info("Pulled " + str(n_files) + " files from " + session.worker)
+    return n_files
+
+def pull_node_results(session, results_dir, incremental=False, exclude=None, log=None):
+    """ Pulls the result files of a worker node into the local results
+    directory, except files named in 'exclude'. Failures are logged, the
+    files stay on the worker.
+    """
+    if log is None:
+        log = LOG
+    sources = node_result_sources(session.worker)
+    if not sources:
+        return
+    try:
+        pull_tree(session, sources, results_dir, incremental=incremental, exclude=exclude,
+                  log=log)
+    except:
+        log.exception("Failed to pull results from " + session.worker)
+
+def node_result_sources(worker):
+    """ Returns the (remote_path, local_name) pairs pulled from a worker: the
+    output dir of every instrumentation module, saved as <worker>_<dir>, and
+    the worker's results_dir if pull_results_dir is set.
+    """
+    sources = []
+    if config.pull_results_dir:
+        sources.append((config.results_dir, ""))
+    for moduleName in config.instrumentation_modules:
+        location = results_location(moduleName)
+        if location is not None:
+            sources.append((location, worker + "_" + posixpath.basename(location.rstrip("/"))))
+    return sources
 
 ###############################
 ### Execute command locally ###
@@ -223,122 +344,174 @@ def execute_local_command(cmd, function_name="execute_local_command", max_tries=
 ##########################
 ### Reset worker node ###
 ##########################
-def reset(ssh_client, worker, log=None):
-    """ Reboots worker node then checks periodically if it is back up. If
-    config.reset is False, it will skip this command (for debugging only)
+def reset(session, worker, log=None):
+    """ Brings the worker node back to a clean state through its session's
+    backend: the SSH backend reboots it and waits until it is back on a new
+    boot. If config.reset is False, it will skip this command (for debugging
+    only). Returns the measured reset latency in seconds (None if skipped).
+    The session is left connected to the worker.
     """
-    n_tries = 0
-    max_tries = 8
     if log is None:
         log = LOG
 
     # Skip reboot
     if(config.reset == False):
-        return "Success"
-
-    LOG.info("Rebooting...")
-
-    try:
-        execute_remote_command(ssh_client, "sudo reboot")
-    except:
-        log.info('Exception on sudo reboot... assuming reboot in progress')
-
-    # Spin until the e comes up and is ready for SSH
-    log.info("Awaiting completion of reboot for "
-                + worker
-                + ", sleeping for 2 minutes...")
-    sleep(120)
+        return None
 
-    while True:
-        try:
-            out = run(["nc", "-z", "-v", "-w5", worker, "22"],
-                    stderr=STDOUT,
-                    stdout=PIPE)
-        except Exception as ex:
-            log.critical(ex)
-            raise
-        else:
-            if out.returncode == 0:
-                break
-            else:
-                n_tries += 1
-                if n_tries >= max_tries:
-                    log.critical("Failed to reconnect to " + worker)
-                    raise
-                else:
-                    log.error("Connection attempt to "
-                                + worker
-                                + " timed out, retrying (" + str(n_tries)
-                                + " out of " + str(max_tries) + ")...")
-                    sleep(60)
-
-    LOG.info("Node " + worker + " is up at " + str(datetime.date.today()))
+    reset_latency = session.reset(timeout=config.reset_timeout,
+                                  poll_interval=config.reset_poll_interval,
+                                  max_poll_interval=config.reset_poll_max_interval)
+    log.info("Node " + worker + " is up at " + str(datetime.datetime.now())
+             + " after " + str(round(reset_latency, 1)) + " seconds")
+    return reset_latency
 
 ##############################
 ### Initialize worker node ###
 ##############################
-def initialize_remote_server(repo, worker, allocation, log=None):
+# Experiment archives by (repo, campaign results dir)
+_deploy_archives = {}
+_deploy_archive_lock = threading.Lock()
+
+def local_repo_copy(repo, log=None):
+    """ Returns the local path of the experiment repo. A git repo is cloned
+    once into the local cache (and updated on later campaigns) so that it can
+    be packed like a local directory.
+    """
+    if log is None:
+        log = LOG
+    if os.path.exists(repo):
+        return repo
+    cache_dir = os.path.join(os.path.expanduser(config.archive_cache_dir), "repos")
+    path = os.path.join(cache_dir, hashlib.sha256(repo.encode()).hexdigest()[:16],
+                        get_repo_dir())
+    if os.path.isdir(path):
+        log.info("Updating local copy of repo: " + repo + "...")
+        status = execute_local_command(["git", "-C", path, "pull", "--ff-only"], log=log)
+    else:
+        log.info("Cloning repo: " + repo + "...")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        status = execute_local_command(["git", "clone", repo, path], log=log)
+    if status != "Success":
+        raise RuntimeError("Failed to get a local copy of " + repo)
+    return path
+
+def get_deploy_archive(results_dir, log=None):
+    """ Returns (digest, path) of the compressed archive of the experiment
+    repo, instrumentation and runner dirs. Built once per repo and campaign
+    (identified by its 'results_dir'), so that all nodes of a campaign get
+    the same commit while a later campaign packs the repo as it is then. The
+    first node to ask for it builds it while the others wait.
+    """
+    if log is None:
+        log = LOG
+    key = (config.repo, os.path.abspath(results_dir))
+    with _deploy_archive_lock:
+        if key not in _deploy_archives:
+            sources = [(local_repo_copy(config.repo, log=log), get_repo_dir()),
+                       (INSTRUMENTATION_SCRIPTS_DIR, os.path.basename(INSTRUMENTATION_SCRIPTS_DIR)),
+                       (RUNNER_DIR, os.path.basename(RUNNER_DIR))]
+            cache_dir = os.path.join(os.path.expanduser(config.archive_cache_dir), "archives")
+            _deploy_archives[key] = build_archive(sources, cache_dir)
+            log.info("Experiment archive " + _deploy_archives[key][0] + " at "
+                     + _deploy_archives[key][1])
+        return _deploy_archives[key]
+
+def push_experiment_files(session, results_dir, log=None):
+    """ Deploys the experiment repo and the instrumentation and runner
+    scripts to the worker node as one compressed archive keyed by the hash of
+    its content, the campaign's archive of 'results_dir'. The archive is only
+    sent to nodes that do not hold it yet, and only extracted if the node's
+    deployed tree is from a different one.
+    """
+    if log is None:
+        log = LOG
+    digest, archive = get_deploy_archive(results_dir, log=log)
+    remote_archive = REMOTE_CACHE_DIR + "/archives/" + digest + ".tar.gz"
+    deployed = REMOTE_CACHE_DIR + "/deployed"
+    dirs = [get_repo_dir(), os.path.basename(INSTRUMENTATION_SCRIPTS_DIR),
+            os.path.basename(RUNNER_DIR)]
+    state = execute_remote_command(session,
+                "if [ \"$(cat " + deployed + " 2>/dev/null)\" = " + digest + " ]"
+                + "".join(" && [ -d " + d + " ]" for d in dirs)
+                + "; then echo deployed; elif [ -f " + remote_archive + " ]; then echo cached; "
+                + "else echo missing; fi", log=log).strip()
+    if state == "deployed":
+        log.info("Experiment archive " + digest + " already deployed on " + session.worker)
+        return
+    if state == "missing":
+        log.info("Pushing experiment archive " + digest + " to " + session.worker)
+        stream_to_remote(session, archive,
+                         "mkdir -p " + REMOTE_CACHE_DIR + "/archives && cat > " + remote_archive
+                         + ".tmp && mv " + remote_archive + ".tmp " + remote_archive, log=log)
+    else:
+        log.info("Experiment archive " + digest + " already cached on " + session.worker)
+    # Extracted over any existing tree, so results of a resumed campaign are kept
+    execute_remote_command(session, "tar xzf " + remote_archive + " && echo " + digest
+                           + " > " + deployed, log=log)
+
+def prepare_remote_server(session, worker, results_dir, transfers=None, log=None):
+    """ Runs the experiment's initialization script on the worker node and
+    gathers its environment specs into the local results directory. File
+    transfers are made within the 'transfers' context manager, if given.
+    A session that is not isolated from the controller machine (local
+    backend) only gets its results directory created.
+    """
+    if log is None:
+        log = LOG
+    if not session.isolated:
+        log.warning("Commands of " + worker + " run on the controller machine, not running "
+                    "the initialization script and env_info.sh")
+        execute_remote_command(session, "mkdir -p " + config.results_dir, log=log)
+        return
+    # Run initialization script. Results directory will be created here
+    log.info("Running initialization script...")
+    execute_remote_command(session, config.init_script_call, log = log)
+
+    # Gather e specs
+    log.info("Transferring env_info.sh to " + worker)
+    with transfers or nullcontext():
+        session.put(os.path.join(TOOL_BASE_DIR, "env_info.sh"), config.results_dir)
+    execute_remote_command(session, "cd " + config.results_dir + " && ./env_info.sh",
+                                log = log)
+    execute_remote_command(session, "cd " + config.results_dir + " && mv env_out.csv "
+                                + worker + "_env_out.csv", log = log)
+    with transfers or nullcontext():
+        session.get(config.results_dir + "/" + worker + "_env_out.csv", results_dir)
+
+def initialize_remote_server(worker, allocation, results_dir, log=None):
     """ Sets up worker node to begin running tests. Clones experiment
     repo, runs initialization script, and facilitates collectin of e
     specs. e will then be reset to a clean state to begin experimentation
     """
-    max_tries = 3
-    n_tries = 0
-
     if log is None:
         log = LOG
 
     log.info("Initializing " + worker)
     # Attemp to connect to server, and quit if failed
     try:
-        ssh = open_ssh_connection(worker, allocation, log = log)
-        scp = SCPClient(ssh.get_transport())
+        session = open_session(worker, allocation, log = log)
     except:
         log.critical('Faiure to connect on initialization of ' + worker +
                         '. Exiting...')
         raise
 
     try:
-        if os.path.exists(config.repo):
-            log.info("Pushing test repo to worker node repo: [%s]" % config.repo)
-            scp.put(config.repo, os.path.basename(config.repo), recursive=True)
-        elif config.repo.endswith(".git"):
-            # Clone experimets repo
-            log.info("Cloning repo: " + repo + "...")
-            execute_remote_command(ssh, "git clone " + repo, log = log)
-
-        log.info("Pushing instrumentation dir to worker node repo: [%s]" % config.repo)
-        scp.put(INSTRUMENTATION_SCRIPTS_DIR, os.path.basename(INSTRUMENTATION_SCRIPTS_DIR), recursive=True)
-
-        # Run initialization script. Results directory will be created here
-        log.info("Running initialization script...")
-        execute_remote_command(ssh, config.init_script_call, log = log)
-
-        # Gather e specs
-        log.info("Transferring env_info.sh to " + worker)
-        cmd = ["scp",
-               "-i", allocation.public_key,
-                "-o", "StrictHostKeyChecking=no",
-                "env_info.sh",
-                config.user + "@" + worker + ":" + config.results_dir]
-        execute_local_command(cmd, "initialize_remote_server", log = log)
-        execute_remote_command(ssh, "cd " + config.results_dir + " && ./env_info.sh",
-                                    log = log)
-        execute_remote_command(ssh, "cd " + config.results_dir + " && mv env_out.csv "
-                                    + worker + "_env_out.csv", log = log)
+        push_experiment_files(session, results_dir, log = log)
+        prepare_remote_server(session, worker, results_dir, log = log)
     except:
         log.exception('Failed to run initialization script for ' + worker +
                         '. Exiting...')
+        session.close()
         raise
 
     # Reset to clean state
     try:
-        reset(ssh, worker)
+        reset(session, worker, log=log)
     except:
         log.critical(worker + " failed to reset...exiting.")
         raise
-
-    ssh.close()
+    finally:
+        session.close()
 
 ######################
 ### Access wrapper ###
@@ -399,10 +572,26 @@ def release_cloudlab(args, allocation):
 #####################################################
 ### sets up node and returns list of tests ####
 #####################################################
-def coordinate_initialization(allocation):
+def retrieve_test_commands(session, log=None):
+    """ Runs the experiment configuration script on a worker node and
+    returns the list of test commands it prints to stdout.
+    """
+    if log is None:
+        log = LOG
+    # Call function to print list of tests and direct to stdout
+    log.info("Retrieving test commands from " + session.worker + "...")
+    f = io.StringIO()
+    with redirect_stdout(f):
+        execute_remote_command(session, config.exp_script_call,
+                                print_to_console=True, log=log)
+    tests = f.getvalue()
+    tests = tests.splitlines()
+    return list(filter(None, tests))
+
+def coordinate_initialization(allocation, results_dir):
     if(len(allocation.hostnames) == 1):
         try:
-            initialize_remote_server(config.repo, allocation.hostnames[0], allocation)
+            initialize_remote_server(allocation.hostnames[0], allocation, results_dir)
         except:
             sys.exit(2)
     elif len(allocation.hostnames) > 1:
@@ -411,7 +600,7 @@ def coordinate_initialization(allocation):
         for n, host in enumerate(allocation.hostnames):
             t_log = configure_logging("main.Thread." + str(n), debug=config.verbose, filename=host+".log")
             threads[n] = ThreadWithReturn(target = initialize_remote_server,
-                                          args = (config.repo, host, allocation, t_log,),
+                                          args = (host, allocation, results_dir, t_log,),
                                           name = host)
             threads[n].start()
 
@@ -431,250 +620,1030 @@ def coordinate_initialization(allocation):
         sys.exit(2)
 
     # Pick first allocation to retrieve test command list
-    ssh = open_ssh_connection(allocation.hostnames[0], allocation)
-    # Call function to print list of tests and direct to stdout
-    LOG.info("Retrieving test commands from " + allocation.hostnames[0] + "...")
-    f = io.StringIO()
-    with redirect_stdout(f):
-        try:
-            execute_remote_command(ssh, config.exp_script_call,
-                                    print_to_console=True)
-        except:
-            LOG.critical('Failed to retrieve test commands...exiting.')
-            sys.exit(2)
-    tests = f.getvalue()
-    tests = tests.splitlines()
-    tests = list(filter(None, tests))
-    ssh.close()
+    session = open_session(allocation.hostnames[0], allocation)
+    try:
+        tests = retrieve_test_commands(session)
+    except:
+        LOG.critical('Failed to retrieve test commands...exiting.')
+        sys.exit(2)
+    session.close()
     return tests
 
 #################################################################
 ### Run remote tests on worker node and record metadata ###
 #################################################################
-def run_remote_experiment(worker, allocation, test_dict, n_runs, results_dir, directory,log=None):
-    """ Runs tests on worker node in either a fixed, arbitrary order or
-    a random order. Runs will be executed 'n_runs' times, and results will be saved
-    on the worker end. Upon completion, each run and its metadata will be stored.
+TEST_RESULT_COLUMNS = ("run_uuid", "hostname", "run_num", "total_runs",
+                       "test_command", "test_number", "order_number",
+                       "order_type", "time_start", "time_stop",
+                       "completion_status", "result", "controller_duration",
+                       "remote_duration")
+RUN_RESULT_COLUMNS = ("run_uuid", "hostname", "run_num", "total_runs",
+                      "order_type", "random_seed", "time_start",
+                      "time_stop", "reset_latency")
+
+def get_order_type(run_num, n_runs):
+    """ Returns 'fixed' or 'random' for run number 'run_num' out of 'n_runs'
+    total runs, interleaved or not depending on config.interleave
     """
-    test_data = []
-    run_data = []
-    run_times = []
-    est_remaing_time = 0
-    n_runs = n_runs * 2
-
-    # add random runs to fixed calculation
-    tests = list(test_dict.keys())
-    if log is None:
-        log = LOG
-    # Set seed
-    rand_seed = config.seed if config.seed else time.time()
-    random.seed(rand_seed)
+    if config.interleave:
+        return 'fixed' if run_num % 2 == 0 else 'random'
+    else:
+        return 'fixed' if run_num < (n_runs / 2) else 'random'
 
-    # Begin runs n times
+def build_schedule(tests, n_runs, rand_seed):
+    """ Returns the ordered list of runs as (run_num, order_type, ordered_tests)
+    tuples. Random orders are drawn from a generator private to this schedule,
+    so concurrent nodes do not interfere with each other's sequences.
+    """
+    rng = random.Random(rand_seed)
+    schedule = []
     for x in range(n_runs):
-
-        id = uuid.uuid1()
-        ssh = open_ssh_connection(worker, allocation, log)
-        if config.interleave:
-            order = 'fixed' if x % 2 == 0 else 'random'
-        else:
-            order = 'fixed' if x < (n_runs / 2) else 'random'
-        log.info("Running loop " + str(x + 1) + " of " + str(n_runs) + " in " + order + " order.")
-
-        if x > 0:
-            est_time_remaining = mean(run_times) * (n_runs - x)
-            est_time_remaining = str(datetime.timedelta(seconds=est_time_remaining))
-            log.info('\033[1m' + 'ESTIMATED TIME REMAINING: ' + est_time_remaining + '\033[0m')
-
+        order = get_order_type(x, n_runs)
         if order == "random":
-            ordered_tests = random.sample(tests, len(tests))
+            ordered_tests = rng.sample(tests, len(tests))
         else:
             ordered_tests = tests
-
-        run_start = timer()
-        # Run each command provided by user
-        for i, test in enumerate(ordered_tests):
-            # Update the dict used by instrumentation scripts
-            ENVIRONMENT_DICT["ORDER"] = order
-            ENVIRONMENT_DICT["TEST_NUM"] = test
-            ENVIRONMENT_DICT["RUN_ID"] = id
-
-            # Get test command from dictionary
-            cmd = test_dict.get(test)
-            log.info("Running " + cmd + "...")
-            start = time.process_time()
-            setup_env_file(ssh, env_dict=ENVIRONMENT_DICT)
-            runCmd = "cd %s && %s" % (directory, cmd)
-            runCmd = "/bin/bash -c {}".format(
-                shlex.quote("source ~/instr_env.txt;" + runCmd))
+        schedule.append((x, order, ordered_tests))
+    return schedule
+
+PLAN_FILE = "campaign_plan.json"
+# Lane shared by all nodes in pooled scheduling
+POOL_LANE = "pool"
+
+def make_plan(tests, lanes, timestamp):
+    """ Returns the plan of a campaign: its test commands and, for every lane
+    (the sequence of runs originally assigned to one node), the random seed
+    and the full run schedule. With pooled scheduling there is a single lane
+    whose runs are shared by all nodes. The plan is saved with the results so
+    that an interrupted campaign can be resumed with exactly the same orders.
+    """
+    n_runs = config.n_runs * 2
+    plan = {"timestamp": timestamp, "tests": tests, "n_runs": n_runs,
+            "scheduling": config.scheduling, "lanes": {}}
+    if config.scheduling == "pooled":
+        lanes = [POOL_LANE]
+    for lane in lanes:
+        rand_seed = config.seed if config.seed else time.time()
+        plan["lanes"][lane] = {"random_seed": rand_seed,
+                               "schedule": build_schedule(list(range(len(tests))),
+                                                          n_runs, rand_seed)}
+    return plan
+
+def save_plan(plan, results_dir):
+    path = os.path.join(results_dir, PLAN_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(plan, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def load_plan(results_dir):
+    with open(os.path.join(results_dir, PLAN_FILE)) as f:
+        plan = json.load(f)
+    for lane_plan in plan["lanes"].values():
+        lane_plan["schedule"] = [tuple(run) for run in lane_plan["schedule"]]
+    return plan
+
+def remaining_runs(plan, results_dir, lane):
+    """ Returns the runs of a lane that have no record in its run journal(s).
+    A run interrupted part way is repeated from its first test, since its
+    remaining tests would otherwise run without the tests that preceded them
+    in the order.
+    """
+    if lane == POOL_LANE:
+        # Pooled runs are journaled by whichever node executed them
+        paths = glob.glob(journal_path(results_dir, "*", "run"))
+    else:
+        paths = [journal_path(results_dir, lane, "run")]
+    done = {r["run_num"] for path in paths for r in read_journal(path)}
+    return [run for run in plan["lanes"][lane]["schedule"] if run[0] not in done]
+
+def make_monitor(plan, results_dir=None, log=None):
+    """ Returns the ConvergenceMonitor shared by all nodes when adaptive
+    early stopping is enabled, None otherwise. When resuming a campaign in
+    'results_dir', the monitor is seeded with the runs already journaled.
+    """
+    if not config.adaptive:
+        return None
+    tests = plan["tests"]
+    names = {i: value_names(tests[i], config.result_names) for i in range(len(tests))}
+    monitor = ConvergenceMonitor(range(len(tests)),
+                                 rel_width=config.adaptive_rel_ci_width,
+                                 min_runs=config.adaptive_min_runs,
+                                 stable_evals=config.adaptive_stable_evals,
+                                 value_names={i: n for i, n in names.items() if n is not None})
+    if results_dir is not None:
+        seed_monitor(monitor, results_dir, log=log)
+    return monitor
+
+def successful_results(order, outcomes):
+    """ Results of a run for a ConvergenceMonitor, from the (completion
+    status, result) of each of its tests. Like toolstats.process_data,
+    failed tests are left out, and so is a whole fixed run with a failed
+    test (None is returned then).
+    """
+    if order == "fixed" and any(status != "Success" for status, _ in outcomes.values()):
+        return None
+    return {test: value for test, (status, value) in outcomes.items() if status == "Success"}
+
+def seed_monitor(monitor, results_dir, log=None):
+    """ Replays the completed runs of the journals in 'results_dir' into
+    'monitor', in the order they started, evaluating after each run as the
+    nodes did when they ran them
+    """
+    if log is None:
+        log = LOG
+    runs = [r for path in glob.glob(journal_path(results_dir, "*", "run"))
+            for r in read_journal(path)]
+    if not runs:
+        return
+    outcomes = {}
+    for path in glob.glob(journal_path(results_dir, "*", "test")):
+        for r in read_journal(path):
+            outcomes.setdefault(str(r["run_uuid"]), {})[r["test_number"]] = \
+                (r.get("completion_status"), r.get("result"))
+    # Tests of interrupted runs have no run record and are not replayed
+    runs.sort(key=lambda r: r["time_start"])
+    for run in runs:
+        results = successful_results(run["order_type"], outcomes.get(str(run["run_uuid"]), {}))
+        if results is not None:
+            monitor.add_run(run["order_type"], results)
+        monitor.evaluate()
+    log.info("Convergence monitor seeded with " + str(len(runs)) + " completed runs, "
+             + str(len(monitor.decided)) + " tests already decided")
+
+def save_convergence(monitor, plan, results_dir):
+    if monitor is not None:
+        monitor.to_frame(plan["tests"]).to_csv(results_dir + "/" + plan["timestamp"]
+                                               + "_convergence.csv", index=False)
+
+class RunQueue():
+    """ Queue of runs that one or more nodes pull from as they become free.
+    In replicated scheduling every node has its own queue, in pooled
+    scheduling all nodes share one (work-stealing style).
+    """
+    def __init__(self, runs, n_workers=1):
+        self.n_workers = n_workers
+        self._queue = queue.Queue()
+        for run in runs:
+            self._queue.put(run)
+
+    def __iter__(self):
+        while True:
             try:
-                execute_remote_command(ssh, runCmd, log=log)
-            except KeyboardInterrupt:
-                result = "Failure"
-                print("We have a keyboard interrupt.")
-            except:
-                result = "Failure"
-            else:
-                result = "Success"
-            stop = time.process_time()
-            # Save test with completion status and metadata
-            test_result = [id, worker, x, n_runs, cmd, test, i, order, start, stop, result]
-            test_data.append(test_result)
-            test_results_csv = pd.DataFrame(test_data,
-                                    columns=("run_uuid", "hostname", "run_num", "total_runs",
-                                            "test_command", "test_number", "order_number",
-                                            "order_type", "time_start", "time_stop",
-                                            "completion_status"))
-            test_results_csv.to_csv(results_dir + "/test_results_temp.csv", index=False)
-
-        # Collect run information
-        run_stop = timer()
-        run_results = [id, worker, x, n_runs, order, rand_seed, run_start, run_stop]
-        run_data.append(run_results)
-        run_results_csv = pd.DataFrame(run_data,
-                                    columns=("run_uuid", "hostname", "run_num", "total_runs",
-                                            "order_type", "random_seed", "time_start",
-                                            "time_stop"))
-        run_results_csv.to_csv(results_dir + "/run_results_temp.csv", index=False)
-
+                yield self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def __len__(self):
+        return self._queue.qsize()
+
+def make_run_queues(plan, results_dir, lanes):
+    """ Returns {host: RunQueue} for the nodes assigned to 'lanes' """
+    queues = {}
+    for lane in set(lanes.values()):
+        hosts = [h for h, l in lanes.items() if l == lane]
+        run_queue = RunQueue(remaining_runs(plan, results_dir, lane), n_workers=len(hosts))
+        for host in hosts:
+            queues[host] = run_queue
+    return queues
+
+def assign_lanes(plan, results_dir, hostnames, log=None):
+    """ Maps nodes to the lanes that still have runs left. A lane continues on
+    its original node if that node is available, otherwise on a node of the
+    allocation that has no lane of its own.
+    """
+    if log is None:
+        log = LOG
+    if POOL_LANE in plan["lanes"]:
+        # Every node pulls from the shared pool
+        if not remaining_runs(plan, results_dir, POOL_LANE):
+            return {}
+        return {host: POOL_LANE for host in hostnames}
+    spare = [h for h in hostnames if h not in plan["lanes"]]
+    assignment = {}
+    for lane in plan["lanes"]:
+        if not remaining_runs(plan, results_dir, lane):
+            continue
+        if lane in hostnames:
+            assignment[lane] = lane
+        elif spare:
+            host = spare.pop(0)
+            log.info("Continuing runs of " + lane + " on replacement node " + host)
+            assignment[host] = lane
+        else:
+            log.error("No node available to continue the runs of " + lane)
+    return assignment
+
+# Prefix of the stdout lines that carry a test's result
+RESULT_MARKER = "@@ordersage-result@@ "
+# Prefix of the stdout line that carries a test's duration in nanoseconds
+TIMING_MARKER = "@@ordersage-timing@@ "
+
+def shell_clock_ns(var):
+    """ Shell code setting 'var' to the worker's wall-clock time in
+    nanoseconds, read from bash's $EPOCHREALTIME (bash >= 5, no process
+    started) or else from date
+    """
+    return ('if [ -n "$EPOCHREALTIME" ]; then ' + var + '=${EPOCHREALTIME/[.,]/}000; '
+            + 'else ' + var + '=$(date +%s%N); fi; ')
+
+def wrap_test_command(cmd, directory, test_env):
+    """ Wraps a test command so that it runs with the instrumentation
+    environment, timed on the worker by the wrapping shell itself (see
+    shell_clock_ns), and, once it finishes, echoes its duration prefixed
+    with TIMING_MARKER and the lines it appended to the results file
+    prefixed with RESULT_MARKER. The test's exit status is preserved.
+    """
+    results_path = config.results_dir + "/" + config.results_file
+    script = ("source ~/instr_env.txt;" + env_exports(test_env)
+              + "f=" + results_path + "; n=$(cat $f 2>/dev/null | wc -l); "
+              + shell_clock_ns("t0")
+              + "(cd " + directory + " && " + cmd + "\n); rc=$?; "
+              + shell_clock_ns("t1")
+              + "echo \"" + TIMING_MARKER + "$((t1-t0))\"; "
+              + "tail -n +$((n+1)) $f 2>/dev/null | sed 's/^/" + RESULT_MARKER + "/'; "
+              + "exit $rc")
+    return "/bin/bash -c {}".format(shlex.quote(script))
+
+def parse_test_result(output):
+    """ Returns the result carried by the RESULT_MARKER lines of a test's
+    output, or None if there are none. Several result lines are joined with
+    commas, like a multi-value result.
+    """
+    values = [line[len(RESULT_MARKER):].strip() for line in output.splitlines()
+              if line.startswith(RESULT_MARKER)]
+    if not values:
+        return None
+    return ",".join(values)
+
+def parse_test_duration(output):
+    """ Returns the duration of a test measured on the worker, in seconds,
+    or None if it was not reported (e.g. the connection dropped).
+    """
+    for line in reversed(output.splitlines()):
+        if line.startswith(TIMING_MARKER):
+            try:
+                return int(line[len(TIMING_MARKER):]) / 1e9
+            except ValueError:
+                return None
+    return None
+
+def run_tests_inline(session, test_dict, ordered_tests, directory, run_env, log=None):
+    """ Runs the tests of a run one remote command at a time. Yields
+    (test, time_start, time_stop, status, result, controller_duration,
+    remote_duration) as each test finishes.
+    """
+    if log is None:
+        log = LOG
+    for test in ordered_tests:
+        # Variables used by instrumentation scripts that change per test
+        test_env = dict(run_env, TEST_NUM=test)
+
+        # Get test command from dictionary
+        cmd = test_dict.get(test)
+        log.info("Running " + cmd + "...")
+        start = time.time()
+        start_counter = timer()
+        runCmd = wrap_test_command(cmd, directory, test_env)
+        output = ""
         try:
-            reset(ssh, worker)
+            output = execute_remote_command(session, runCmd, log=log)
+        except KeyboardInterrupt:
+            result = "Failure"
+            print("We have a keyboard interrupt.")
+        except RemoteCommandError as e:
+            output = e.output
+            result = "Failure"
         except:
-            log.warning('Worker ' + worker + 'failed to reset after run ' +\
-                        x + ' of ' + n_runs + '. Ending ' + order + ' run early.')
-            break
+            result = "Failure"
+        else:
+            result = "Success"
+        controller_duration = timer() - start_counter
+        stop = time.time()
+        yield (test, start, stop, result, parse_test_result(output), controller_duration,
+               parse_test_duration(output))
+
+def run_tests_with_agent(session, test_dict, ordered_tests, directory, run_env, log=None):
+    """ Runs all the tests of a run with a single invocation of
+    runner/agent.py on the worker, which streams a record back as each test
+    finishes. Yields the same tuples as run_tests_inline(); the controller
+    timings of a test span from the previous record to its own. Tests left
+    without a record (e.g. the connection dropped) are reported as failures.
+    """
+    if log is None:
+        log = LOG
+    payload = {"directory": directory,
+               "results_file": config.results_dir + "/" + config.results_file,
+               "env": {k: str(v) for k, v in run_env.items()},
+               "tests": [[test, test_dict.get(test)] for test in ordered_tests]}
+    cmd = "/bin/bash -c {}".format(shlex.quote(
+        "source ~/instr_env.txt; exec python3 ~/" + os.path.basename(RUNNER_DIR) + "/agent.py"))
+    log.info("Running " + str(len(ordered_tests)) + " tests with the runner agent...")
+    pending = list(ordered_tests)
+    start = time.time()
+    start_counter = timer()
+    channel = None
+    try:
+        channel = session.open_channel()
+        channel.set_combine_stderr(True)
+        channel.exec_command(cmd)
+        channel.sendall(json.dumps(payload).encode())
+        channel.shutdown_write()
+        for line in channel.makefile("r"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                log.debug(line.rstrip())
+                continue
+            if record.get("type") == "output":
+                log.debug(record["line"])
+                continue
+            stop = time.time()
+            stop_counter = timer()
+            test = record["test"]
+            pending.remove(test)
+            log.info("Finished " + test_dict.get(test) + ": " + record["status"])
+            yield (test, start, stop, record["status"], record["result"],
+                   stop_counter - start_counter, record["duration"])
+            start, start_counter = stop, stop_counter
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            log.error("Runner agent exited with status " + str(exit_status))
+    except KeyboardInterrupt:
+        print("We have a keyboard interrupt.")
+    except Exception as e:
+        log.error("Runner agent failed: " + repr(e))
+    finally:
+        if channel is not None:
+            channel.close()
+    for test in pending:
+        yield (test, start, time.time(), "Failure", None, timer() - start_counter, None)
+
+def execute_run(session, test_dict, run, n_runs, rand_seed, directory, static_env,
+                test_journal, monitor=None, log=None):
+    """ Executes a single run (one pass over 'ordered_tests') on the worker
+    node without resetting it. Each test's metadata is appended to
+    'test_journal' as soon as the test finishes, and the run metadata is
+    returned, to be completed by record_run() once the node has been reset.
+    Each test's result is captured from its output and stored with it. If a
+    ConvergenceMonitor is given, the run's successful results are fed to it
+    (see successful_results). With use_agent, the whole run is handed to the
+    runner agent at once.
+    """
+    if log is None:
+        log = LOG
+    worker = session.worker
+    x, order, ordered_tests = run
+    id = uuid.uuid1()
+    outcomes = {}
+
+    run_start = time.time()
+    # Static instrumentation variables only change across boots
+    setup_env_file(session, static_env)
+    # Run each command provided by user
+    run_tests = run_tests_with_agent if config.use_agent else run_tests_inline
+    records = run_tests(session, test_dict, ordered_tests, directory,
+                        {"ORDER": order, "RUN_ID": id}, log=log)
+    for i, (test, start, stop, result, value, controller_duration, remote_duration) \
+            in enumerate(records):
+        cmd = test_dict.get(test)
+        if value is None:
+            log.warning("No result reported by " + cmd)
+        # Save test with completion status, result, timings and metadata
+        test_result = [id, worker, x, n_runs, cmd, test, i, order, start, stop, result, value,
+                       controller_duration, remote_duration]
+        test_journal.append(test_result)
+        outcomes[test] = (result, value)
+
+    # Collect run information
+    run_stop = time.time()
+
+    if monitor is not None:
+        results = successful_results(order, outcomes)
+        if results is None:
+            log.info("Fixed run " + str(x) + " has a failed test, leaving it out of early stopping")
+        else:
+            monitor.add_run(order, results)
+        for test in monitor.evaluate():
+            if monitor.decided[test]["reason"] == "no_numeric_result":
+                log.warning("Test " + str(test) + " (" + test_dict.get(test) + ") reported no "
+                            "numeric result, leaving it out of early stopping")
+            else:
+                log.info("Test " + str(test) + " (" + test_dict.get(test) + ") has converged: "
+                         + monitor.decided[test]["reason"])
+    return [id, worker, x, n_runs, order, rand_seed, run_start, run_stop]
 
-        ssh.close()
-        run_stop_r = timer()
-        run_times.append(run_stop_r - run_start)
+def record_run(test_journal, run_journal, run_results, reset_latency):
+    """ Stores a completed run along with the latency of the reset that
+    followed it, and forces the run's test records to disk.
+    """
+    test_journal.sync()
+    run_journal.append(run_results + [reset_latency])
+    run_journal.sync()
 
-    return test_data,run_data
+def journal_path(results_dir, name, kind):
+    return results_dir + "/" + name + "_" + kind + "_journal.jsonl"
 
-#########################################################
-###      Workflow for single-node experimentation      ###
-#########################################################
-def run_single_node(worker, allocation, results_dir, tests, timestamp, log=None):
+def journal_name(host, lane):
+    """ Journals are kept per lane, except for pooled runs which are kept
+    per executing node.
+    """
+    return host if lane == POOL_LANE else lane
+
+def open_journals(results_dir, lane):
+    """ Returns the append-only test and run journals of a lane or node """
+    test_journal = ResultJournal(journal_path(results_dir, lane, "test"),
+                                 TEST_RESULT_COLUMNS,
+                                 sync_every=config.journal_sync_every,
+                                 sync_interval=config.journal_sync_interval)
+    run_journal = ResultJournal(journal_path(results_dir, lane, "run"),
+                                RUN_RESULT_COLUMNS)
+    return test_journal, run_journal
+
+def run_step(session, test_dict, run, runs, n_runs, rand_seed, test_journal, run_journal,
+             directory, static_env, run_times, monitor=None, results_dir=None,
+             reboots=None, transfers=None, log=None):
+    """ Takes a node through one run pulled from the RunQueue 'runs': logs
+    the estimated time remaining, executes the run, resets the node, records
+    the run and, if 'results_dir' is given and incremental_pull is set, pulls
+    the new result files. The duration of the run is added to 'run_times'.
+    The reset and the pull are made within the 'reboots' and 'transfers'
+    context managers, if given. Returns False once the node must stop: every
+    test has converged or the node failed to reset.
+    """
     if log is None:
         log = LOG
-    log.info("Beginning experimentation for " + worker)
+    worker = session.worker
+    x, order, _ = run
+    if monitor is not None and monitor.done:
+        log.info("All tests have converged, no more runs needed.")
+        return False
+    log.info("Running loop " + str(x + 1) + " of " + str(n_runs) + " in " + order + " order.")
+
+    if run_times:
+        est_time_remaining = mean(run_times) * (len(runs) + 1) / runs.n_workers
+        est_time_remaining = str(datetime.timedelta(seconds=est_time_remaining))
+        log.info('\033[1m' + 'ESTIMATED TIME REMAINING: ' + est_time_remaining + '\033[0m')
+
+    run_start = timer()
+    run_results = execute_run(session, test_dict, run, n_runs, rand_seed, directory,
+                              static_env, test_journal, monitor=monitor, log=log)
 
-    # Add machine type to results file
-    ssh = open_ssh_connection(worker, allocation, log = log)
+    try:
+        with reboots or nullcontext():
+            reset_latency = reset(session, worker, log=log)
+    except:
+        record_run(test_journal, run_journal, run_results, None)
+        log.warning('Worker ' + worker + ' failed to reset after run ' +\
+                    str(x) + ' of ' + str(n_runs) + '. Ending ' + order + ' run early.')
+        return False
+    record_run(test_journal, run_journal, run_results, reset_latency)
+    if results_dir is not None and config.incremental_pull:
+        # The results file is pulled at the end, once renamed per worker,
+        # so that nodes do not overwrite each other's copy
+        with transfers or nullcontext():
+            pull_node_results(session, results_dir, incremental=True,
+                              exclude=[config.results_file], log=log)
+
+    run_times.append(timer() - run_start)
+    return True
+
+def run_remote_experiment(session, test_dict, runs, n_runs, rand_seed, test_journal,
+                          run_journal, directory, static_env=None, monitor=None,
+                          results_dir=None, log=None):
+    """ Runs tests on worker node in either a fixed, arbitrary order or
+    a random order. Runs are pulled from the RunQueue 'runs' (out of 'n_runs'
+    in total) until it is empty, and results will be saved on the worker end.
+    Upon completion, each run and its metadata will be stored.
+    All runs share the worker's session, which reconnects after each reset.
+    'static_env' is uploaded to the worker once per boot, while the per-test
+    variables are exported inline with each test command. Test and run
+    metadata are appended to the node's journals. With a ConvergenceMonitor,
+    runs stop as soon as every test has converged. If 'results_dir' is given
+    and incremental_pull is set, new result files are pulled after each run.
+    Each run goes through run_step().
+    """
+    run_times = []
 
-    # Assign number to each test and store in dictionary
-    test_dict = {i : tests[i] for i in range(0, len(tests))}
+    if log is None:
+        log = LOG
+    if static_env is None:
+        static_env = {}
 
-    # Extract name of dir where repo code will be cloned (i.e. lowest-level dir in path)
+    # Begin runs n times
+    for run in runs:
+        if not run_step(session, test_dict, run, runs, n_runs, rand_seed, test_journal,
+                        run_journal, directory, static_env, run_times, monitor=monitor,
+                        results_dir=results_dir, log=log):
+            break
+
+#########################################################
+###      Workflow for single-node experimentation      ###
+#########################################################
+def get_repo_dir():
+    """ Returns the name of the dir where repo code is cloned on the worker
+    (i.e. lowest-level dir in path)
+    """
     repo_dir = Path(config.repo).name
-    repo_dir = repo_dir[:-len(".git")] if repo_dir.endswith(".git") else repo_dir
+    return repo_dir[:-len(".git")] if repo_dir.endswith(".git") else repo_dir
 
-    # Configure instrumentation
+def setup_node(session, timestamp, log=None):
+    """ Configures instrumentation modules on the worker node and returns the
+    static environment for its tests. Each node keeps its own environment so
+    that concurrent nodes never see each other's variables.
+    """
+    if log is None:
+        log = LOG
+    if config.instrumentation_modules and not session.isolated:
+        raise RuntimeError("Instrumentation modules would run on the controller machine with "
+                           "the local backend, remove them from instrumentation_modules")
+    static_env = {}
     for moduleName in config.instrumentation_modules:
-        configure_instr_module(partial(execute_remote_command, ssh, log=log), moduleName, ENVIRONMENT_DICT, log=log)
-
-    # Run tests, returns lists to add to dataframe
-    ENVIRONMENT_DICT["TIMESTAMP"] = timestamp
-    test_results, run_results = run_remote_experiment(worker, allocation, test_dict, config.n_runs, results_dir,
-                                                 directory=repo_dir, log=log)
-
-    # Create dataframe of individual tests for csv
-    test_results_csv = pd.DataFrame(test_results,
-                                    columns=("run_uuid", "hostname", "run_num", "total_runs",
-                                            "test_command", "test_number", "order_number",
-                                            "order_type", "time_start", "time_stop",
-                                            "completion_status"))
-    run_results_csv = pd.DataFrame(run_results,
-                                    columns=("run_uuid", "hostname", "run_num", "total_runs",
-                                            "order_type", "random_seed", "time_start",
-                                            "time_stop"))
+        configure_instr_module(partial(execute_remote_command, session, log=log), moduleName, static_env, log=log)
+    static_env["TIMESTAMP"] = timestamp
+    return static_env
+
+def collect_node_results(session, allocation, results_dir, timestamp, log=None):
+    """ Pulls the instrumentation outputs, and optionally the worker's whole
+    results directory, into the local results directory. Test results
+    themselves are already captured as each test finishes.
+    """
+    if log is None:
+        log = LOG
+    worker = session.worker
+    repo_dir = get_repo_dir()
 
     results_with_hostname = worker + "_" + config.results_file
-    ssh = open_ssh_connection(worker, allocation, log = log)  # reopen ssh connection
     try:
-        execute_remote_command(ssh, "cd " + config.results_dir + " && "
+        # mv keeps the file's mtime, touch makes an incremental pull see it
+        execute_remote_command(session, "cd " + config.results_dir + " && "
                                 + "mv " + config.results_file + " "
-                                + results_with_hostname)
+                                + results_with_hostname + " && touch "
+                                + results_with_hostname, log=log)
     except:
         log.warning('Failed to rename results file from ' + config.results_file +\
                     ' to ' + results_with_hostname)
 
-    # scp everything in results directory from worker and rename with timestamp
+    # Pull instrumentation outputs (and results_dir) from worker in one stream
     log.info("Transferring results from " + worker + " to local")
-    # "-o StrictHostKeyChecking=no" is supposed to help avoid answering "yes" for new machines
-    cmd = ["scp", "-i", allocation.public_key, "-o", "StrictHostKeyChecking=no", "-r",
-            config.user + "@" + worker + ":" + config.results_dir + "/*",
-            "./" + results_dir]
-    execute_local_command(cmd)
-
-    # pull instrumentation results from worker
-    for moduleName in config.instrumentation_modules:
-        pull_results(ssh, moduleName, results_dir, log)
-
-    ssh.close()
-
-    # Gather results
-    with open(results_dir + "/" + results_with_hostname) as f:
-        results = f.readlines()
-    results = [x.strip() for x in results]
-
-    # Add results to dataframe and save as csv specific to host
-    log.info("Adding results to test metadata")
-
-    ri = 0
-    res = []
-
-    if len(test_results_csv) != len(results):
-        #Incase the test results meta generated on ordersage controller does not match
-        #the results generated in the worker. Try to fill in the empty values.
-        #This would only occur in case of failures when the tests running on the worker donot
-        #add dummy result value in the results file.
-        for i in test_results_csv.index:
-            if test_results_csv["completion_status"][i] == 'Failure':
-                # Adding dummy data
-                res.append(0)
-            else:
-                res.append(results[ri])
-                ri = ri + 1
-    else:
-        res = results
-
-    test_results_csv["result"] = res
-
-    test_results_csv.to_csv(results_dir + "/" + worker + "_test_results.csv", index=False)
-    run_results_csv.to_csv(results_dir + "/" + worker + "_run_results.csv", index=False)
+    pull_node_results(session, results_dir, incremental=config.incremental_pull, log=log)
 
     # Move repo to new directory with timestamped name
-    ssh = open_ssh_connection(worker, allocation, log = log)
     try:
-        execute_remote_command(ssh, 'mv ' + repo_dir + ' ' + timestamp + '_' + repo_dir)
+        execute_remote_command(session, 'mv ' + repo_dir + ' ' + timestamp + '_' + repo_dir,
+                               log=log)
     except:
         log.warning('Experiment repo on ' + worker + ' unsuccessfully moved to ' +\
                     repo_dir + ' ' + timestamp + '_' + repo_dir +
                     '. Please delete or change before re-running controller.py')
-    ssh.close()
+
+def materialize_journals(results_dir, log=None):
+    """ Turns the test and run journals in results_dir into the per-node csv
+    files, once all nodes are done. Tests of runs that were interrupted
+    before completion (and repeated in a later run) are dropped, and the
+    per-test measures of the instrumentation modules (e.g. perf counters)
+    are added as columns.
+    """
+    if log is None:
+        log = LOG
+    fmt = resolve_format(config.results_format, log=log)
+    # Per-test measures of the instrumentation modules, joined to every node's tests
+    module_results = []
+    for moduleName in config.instrumentation_modules:
+        df = load_results(moduleName, results_dir)
+        if df is not None:
+            log.info("Merging " + str(df.shape[1] - 2) + " measures of " + moduleName
+                     + " with the test results")
+            module_results.append(df)
+
+    suffix = "_test_journal.jsonl"
+    for path in sorted(glob.glob(journal_path(results_dir, "*", "test"))):
+        name = os.path.basename(path)[:-len(suffix)]
+        test_results_csv = pd.DataFrame(read_journal(path), columns=TEST_RESULT_COLUMNS)
+        run_results_csv = pd.DataFrame(read_journal(journal_path(results_dir, name, "run")),
+                                       columns=RUN_RESULT_COLUMNS)
+
+        # Save as csv specific to host
+        log.info("Saving results of " + name)
+        test_results_csv = test_results_csv[test_results_csv["run_uuid"].isin(run_results_csv["run_uuid"])]
+        test_results_csv = test_results_csv.astype({"run_uuid": str, "test_number": np.int64})
+        for df in module_results:
+            test_results_csv = test_results_csv.merge(df, how="left", on=["run_uuid", "test_number"])
+
+        save_table(apply_schema(test_results_csv, "test"),
+                   results_dir + "/" + name + "_test_results", fmt)
+        save_table(apply_schema(run_results_csv, "run"),
+                   results_dir + "/" + name + "_run_results", fmt)
+
+def run_single_node(worker, allocation, results_dir, plan, lane=None, runs=None,
+                    monitor=None, log=None):
+    """ Runs the remaining runs of a lane of the campaign plan on a worker
+    node, pulling them from 'runs' when the lane's RunQueue is shared with
+    other nodes. The lane defaults to the worker itself.
+    """
+    if log is None:
+        log = LOG
+    if lane is None:
+        lane = worker
+    log.info("Beginning experimentation for " + worker)
+    tests = plan["tests"]
+    timestamp = plan["timestamp"]
+    lane_plan = plan["lanes"][lane]
+    if runs is None:
+        runs = RunQueue(remaining_runs(plan, results_dir, lane))
+        if len(runs) < len(lane_plan["schedule"]):
+            log.info("Resuming " + lane + " with " + str(len(runs)) + " of "
+                     + str(len(lane_plan["schedule"])) + " runs remaining")
+
+    # Single session reused for configuration, all runs and post-processing
+    session = open_session(worker, allocation, log = log)
+
+    # Assign number to each test and store in dictionary
+    test_dict = {i : tests[i] for i in range(0, len(tests))}
+
+    # Configure instrumentation
+    static_env = setup_node(session, timestamp, log=log)
+
+    # Run tests, recording them in the journals
+    test_journal, run_journal = open_journals(results_dir, journal_name(worker, lane))
+    try:
+        run_remote_experiment(session, test_dict, runs, plan["n_runs"],
+                              lane_plan["random_seed"], test_journal, run_journal,
+                              directory=get_repo_dir(), static_env=static_env,
+                              monitor=monitor, results_dir=results_dir, log=log)
+    finally:
+        test_journal.close()
+        run_journal.close()
+
+    collect_node_results(session, allocation, results_dir, timestamp, log=log)
+    session.close()
 
     log.info("Experiemnt completed on node (%s) and stored" % worker)
 
 ##################################################################
 ### Workflow for experimentation using multiple-nodes #############
 ##################################################################
-def run_multiple_nodes(allocation, results_dir, tests, timestamp):
-    threads = [None] * len(allocation.hostnames)
+def run_multiple_nodes(allocation, results_dir, plan, lanes, monitor=None):
+    threads = [None] * len(lanes)
+    run_queues = make_run_queues(plan, results_dir, lanes)
 
-    for n, host in enumerate(allocation.hostnames):
+    for n, (host, lane) in enumerate(lanes.items()):
         t_log = configure_logging("main.Thread." + str(n), debug=config.verbose, filename=host+".log")
         threads[n] = ThreadWithReturn(target=run_single_node,
-                                      args=(host, allocation,
-                                            results_dir, tests, timestamp, t_log,),
+                                      args=(host, allocation, results_dir, plan,
+                                            lane, run_queues[host], monitor, t_log,),
                                             name=host)
         threads[n].start()
 
     for t in threads:
         t.join()
 
-def concat_results(results_dir, timestamp, file_pattern, concat_name):
-    df = pd.concat(map(pd.read_csv, glob.glob(os.path.join(results_dir, file_pattern))))
-    df.to_csv(results_dir + "/" + timestamp + concat_name, index=False)
+##################################################################
+### Pipelined experimentation ####################################
+##################################################################
+class PipelinedCampaign():
+    """ State shared by the nodes of a pipelined campaign, where each node
+    goes from initialization straight to its runs instead of waiting for the
+    whole allocation. The first node that is ready retrieves the test
+    commands and creates the plan; every node then claims a lane. Shared by
+    all nodes, so every method is thread-safe.
+    """
+    def __init__(self, allocation, results_dir, timestamp, plan=None, log=None):
+        self.allocation = allocation
+        self.results_dir = results_dir
+        self.timestamp = timestamp
+        self.plan = plan
+        self.monitor = make_monitor(plan, results_dir) if plan is not None else None
+        self.log = log if log is not None else LOG
+        self.claimed = {}
+        self.run_queues = {}
+        self._lock = threading.Lock()
+
+    def ensure_plan(self, host, session=None, log=None):
+        """ Returns the campaign plan, creating it from the test commands of
+        'host' if no node has done so yet. Lanes are created for every node
+        of the allocation.
+        """
+        if log is None:
+            log = self.log
+        with self._lock:
+            if self.plan is not None:
+                return self.plan
+            own_session = session is None
+            if own_session:
+                session = open_session(host, self.allocation, log=log)
+            try:
+                tests = retrieve_test_commands(session, log=log)
+            finally:
+                if own_session:
+                    session.close()
+            self.plan = make_plan(tests, self.allocation.hostnames, self.timestamp)
+            save_plan(self.plan, self.results_dir)
+            self.monitor = make_monitor(self.plan, self.results_dir, log=log)
+            return self.plan
+
+    def claim_lane(self, host):
+        """ Returns (lane, RunQueue) for a ready node, or (None, None) if there
+        are no runs left for it. A node takes its own lane, or else the lane
+        of a node that is not part of the allocation (e.g. when resuming on a
+        different set of nodes).
+        """
+        with self._lock:
+            if POOL_LANE in self.plan["lanes"]:
+                lane = POOL_LANE
+            else:
+                candidates = [host] + [l for l in self.plan["lanes"]
+                                       if l not in self.allocation.hostnames]
+                lane = None
+                for candidate in candidates:
+                    if candidate in self.plan["lanes"] and candidate not in self.claimed.values() \
+                            and remaining_runs(self.plan, self.results_dir, candidate):
+                        lane = candidate
+                        break
+                if lane is None:
+                    return None, None
+            if lane not in self.run_queues:
+                # Only the pooled lane is shared, by every node of the allocation
+                n_workers = len(self.allocation.hostnames) if lane == POOL_LANE else 1
+                self.run_queues[lane] = RunQueue(remaining_runs(self.plan, self.results_dir, lane),
+                                                 n_workers=n_workers)
+            self.claimed[host] = lane
+            return lane, self.run_queues[lane]
+
+    def unclaimed_lanes(self):
+        """ Returns the lanes with runs left that no node has claimed, e.g.
+        the lanes of nodes that failed to initialize
+        """
+        with self._lock:
+            return [l for l in self.plan["lanes"] if l not in self.claimed.values()
+                    and remaining_runs(self.plan, self.results_dir, l)]
+
+def run_pipelined_node(host, campaign, log=None):
+    """ Initializes a worker node, then immediately runs the lane it claims """
+    if log is None:
+        log = LOG
+    initialize_remote_server(host, campaign.allocation, campaign.results_dir, log=log)
+    plan = campaign.ensure_plan(host, log=log)
+    lane, runs = campaign.claim_lane(host)
+    if lane is None:
+        log.info("No runs left for " + host)
+        return
+    if lane != host:
+        log.info("Continuing runs of " + lane + " on " + host)
+    run_single_node(host, campaign.allocation, campaign.results_dir, plan, lane, runs,
+                    campaign.monitor, log)
+
+def report_unclaimed_lanes(campaign):
+    for lane in campaign.unclaimed_lanes():
+        LOG.warning("Runs of " + lane + " were not executed. Use --resume "
+                    + campaign.results_dir + " to run them.")
+
+def run_pipelined(allocation, results_dir, timestamp, plan=None):
+    """ Runs a campaign where each node starts experimenting as soon as its
+    own initialization completes. Returns the PipelinedCampaign.
+    """
+    campaign = PipelinedCampaign(allocation, results_dir, timestamp, plan=plan)
+    threads = [None] * len(allocation.hostnames)
+    for n, host in enumerate(allocation.hostnames):
+        t_log = configure_logging("main.Thread." + str(n), debug=config.verbose, filename=host+".log")
+        threads[n] = ThreadWithReturn(target=run_pipelined_node,
+                                      args=(host, campaign, t_log,),
+                                      name=host)
+        threads[n].start()
+
+    for t in threads:
+        try:
+            t.join()
+        except:
+            LOG.exception("Experimentation failed on " + t.name)
+
+    if campaign.plan is None:
+        LOG.critical('All nodes failed to initialize. Exiting...')
+        sys.exit(2)
+    report_unclaimed_lanes(campaign)
+    save_convergence(campaign.monitor, campaign.plan, results_dir)
+    return campaign
+
+##################################################################
+### Event-loop orchestration for many-node campaigns #############
+##################################################################
+class LoopSemaphore():
+    """ Context manager holding an asyncio.Semaphore of 'loop' from a thread
+    of the pool, so that blocking steps made within a larger one (e.g. the
+    reset at the end of a run) count towards the orchestrator's limits.
+    """
+    def __init__(self, semaphore, loop):
+        self.semaphore = semaphore
+        self.loop = loop
+
+    def __enter__(self):
+        asyncio.run_coroutine_threadsafe(self.semaphore.acquire(), self.loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.semaphore.release)
+        return False
+
+class AsyncOrchestrator():
+    """ Drives initialization, test execution, reset polling and result
+    pulls of every worker node from a single asyncio event loop.
+
+    paramiko is a blocking library, so each blocking step is dispatched to a
+    shared thread pool while the event loop schedules the steps of all nodes.
+    Semaphores bound how many connections, reboots and transfers may be in
+    flight at the same time across the whole allocation. Node messages are
+    logged through child loggers of the main logger instead of one
+    FileHandler per node.
+    """
+    def __init__(self, allocation, results_dir, timestamp, plan=None, log=None):
+        self.allocation = allocation
+        self.results_dir = results_dir
+        self.timestamp = timestamp
+        self.plan = plan
+        self.monitor = None
+        self.log = log if log is not None else LOG
+        self.sessions = {}
+        self.executor = ThreadPoolExecutor(max_workers=len(allocation.hostnames) + 1,
+                                           thread_name_prefix="ordersage")
+
+    def node_log(self, host):
+        return self.log.getChild(host)
+
+    async def call(self, fn, *args, **kwargs):
+        """ Runs a blocking function on the thread pool """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def connect(self, host, log):
+        async with self.connects:
+            return await self.call(open_session, host, self.allocation, log=log)
+
+    async def reset(self, session, log):
+        async with self.reboots:
+            return await self.call(reset, session, session.worker, log=log)
+
+    async def initialize(self, host):
+        log = self.node_log(host)
+        log.info("Initializing " + host)
+        session = await self.connect(host, log)
+        try:
+            async with self.transfers:
+                await self.call(push_experiment_files, session, self.results_dir, log=log)
+            await self.call(prepare_remote_server, session, host, self.results_dir,
+                            transfers=LoopSemaphore(self.transfers, self.loop), log=log)
+            await self.reset(session, log)
+        except:
+            log.exception('Failed to initialize ' + host)
+            session.close()
+            raise
+        self.sessions[host] = session
+
+    async def run_node(self, host, lane, runs):
+        log = self.node_log(host)
+        session = self.sessions[host]
+        log.info("Beginning experimentation for " + host)
+        tests = self.plan["tests"]
+        test_dict = {i : tests[i] for i in range(0, len(tests))}
+        n_runs = self.plan["n_runs"]
+        rand_seed = self.plan["lanes"][lane]["random_seed"]
+        try:
+            static_env = await self.call(setup_node, session, self.timestamp, log=log)
+            test_journal, run_journal = open_journals(self.results_dir, journal_name(host, lane))
+            try:
+                run_times = []
+                for run in runs:
+                    if not await self.call(run_step, session, test_dict, run, runs, n_runs,
+                                           rand_seed, test_journal, run_journal, get_repo_dir(),
+                                           static_env, run_times, monitor=self.monitor,
+                                           results_dir=self.results_dir,
+                                           reboots=LoopSemaphore(self.reboots, self.loop),
+                                           transfers=LoopSemaphore(self.transfers, self.loop),
+                                           log=log):
+                        break
+            finally:
+                test_journal.close()
+                run_journal.close()
+            async with self.transfers:
+                await self.call(collect_node_results, session, self.allocation,
+                                self.results_dir, self.timestamp, log=log)
+        finally:
+            session.close()
+        log.info("Experiemnt completed on node (%s) and stored" % host)
+
+    def create_limits(self):
+        """ Creates the semaphores bounding concurrent connections, reboots
+        and transfers. Must be called from the running loop they bind to.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.connects = asyncio.Semaphore(config.max_concurrent_connects)
+        self.reboots = asyncio.Semaphore(config.max_concurrent_reboots)
+        self.transfers = asyncio.Semaphore(config.max_concurrent_transfers)
+
+    async def run_lanes(self, lanes):
+        """ Runs the remaining runs of each lane on the connected node it is
+        assigned to ({host: lane}) and returns the hosts that failed
+        """
+        run_queues = make_run_queues(self.plan, self.results_dir, lanes)
+        outcomes = await asyncio.gather(*(self.run_node(h, l, run_queues[h])
+                                          for h, l in lanes.items()),
+                                        return_exceptions=True)
+        failed = []
+        for host, outcome in zip(lanes, outcomes):
+            if isinstance(outcome, BaseException):
+                self.log.error("Experimentation failed on " + host + ": " + repr(outcome))
+                failed.append(host)
+        return failed
+
+    async def run(self):
+        """ Initializes all nodes, retrieves the test list (unless resuming a
+        saved plan) and runs the remaining runs of every lane on the nodes
+        that initialized successfully.
+        """
+        self.create_limits()
+
+        hosts = list(self.allocation.hostnames)
+        outcomes = await asyncio.gather(*(self.initialize(h) for h in hosts),
+                                        return_exceptions=True)
+        for host, outcome in zip(hosts, outcomes):
+            if isinstance(outcome, BaseException):
+                self.log.error("Removing " + host + " after failed initialization: " + repr(outcome))
+                self.allocation.hostnames.remove(host)
+        if len(self.allocation.hostnames) == 0:
+            self.log.critical('All nodes failed to initialize. Exiting...')
+            sys.exit(2)
+
+        if self.plan is None:
+            first = self.allocation.hostnames[0]
+            try:
+                tests = await self.call(retrieve_test_commands, self.sessions[first],
+                                        log=self.node_log(first))
+            except:
+                self.log.critical('Failed to retrieve test commands...exiting.')
+                sys.exit(2)
+            self.plan = make_plan(tests, self.allocation.hostnames, self.timestamp)
+            save_plan(self.plan, self.results_dir)
+        self.monitor = make_monitor(self.plan, self.results_dir, log=self.log)
+
+        lanes = assign_lanes(self.plan, self.results_dir, self.allocation.hostnames,
+                             log=self.log)
+        for host in self.allocation.hostnames:
+            if host not in lanes:
+                self.sessions.pop(host).close()
+        await self.run_lanes(lanes)
+        save_convergence(self.monitor, self.plan, self.results_dir)
+        self.executor.shutdown()
+
+    async def pipeline(self, host, campaign):
+        """ Initializes a node and runs the lane it claims right away """
+        log = self.node_log(host)
+        await self.initialize(host)
+        await self.call(campaign.ensure_plan, host, self.sessions[host], log=log)
+        # The monitor is created with the plan by whichever node is first
+        self.plan = campaign.plan
+        self.monitor = campaign.monitor
+        lane, runs = campaign.claim_lane(host)
+        if lane is None:
+            log.info("No runs left for " + host)
+            self.sessions.pop(host).close()
+            return
+        await self.run_node(host, lane, runs)
+
+    async def run_pipelined(self):
+        """ Like run(), but each node starts its runs as soon as its own
+        initialization completes instead of waiting for every node.
+        """
+        self.create_limits()
+
+        campaign = PipelinedCampaign(self.allocation, self.results_dir, self.timestamp,
+                                     plan=self.plan, log=self.log)
+        hosts = list(self.allocation.hostnames)
+        outcomes = await asyncio.gather(*(self.pipeline(h, campaign) for h in hosts),
+                                        return_exceptions=True)
+        for host, outcome in zip(hosts, outcomes):
+            if isinstance(outcome, BaseException):
+                self.log.error("Experimentation failed on " + host + ": " + repr(outcome))
+        if campaign.plan is None:
+            self.log.critical('All nodes failed to initialize. Exiting...')
+            sys.exit(2)
+        report_unclaimed_lanes(campaign)
+        save_convergence(campaign.monitor, campaign.plan, self.results_dir)
+        self.executor.shutdown()
+
+def concat_results(results_dir, timestamp, file_pattern, concat_name, fmt="csv", kind=None):
+    """ Concatenates the per-node tables matching 'file_pattern' into a
+    single table saved in format 'fmt'. Tables of a known 'kind' ('test' or
+    'run') are saved with their typed schema.
+    """
+    output = os.path.join(results_dir, timestamp + concat_name)
+    # Skip the output of a previous concatenation, e.g. when resuming
+    files = [f for f in glob.glob(os.path.join(results_dir, file_pattern))
+             if os.path.splitext(os.path.abspath(f))[0] != os.path.abspath(output)]
+    if not files:
+        LOG.warning("No " + file_pattern + " files to concatenate in " + results_dir)
+        return pd.DataFrame()
+    df = pd.concat([load_table(f, kind) for f in files], ignore_index=True)
+    if kind is not None:
+        df = apply_schema(df, kind)
+    save_table(df, output, fmt)
     return df
 
 #####################
@@ -686,32 +1655,71 @@ def main():
     # Allocate resources according to provided arguments
     allocation = access_provider_wrapper(args)
 
-    # Set up results directory with timestamp
-    LOG.info("Setting up local results directory")
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H:%M:%S")
-    results_dir = timestamp + "_results"
-    execute_local_command(["mkdir", results_dir])
-
-    # Initialize each node and retrieve list of commands to run tests
-    test_commands = coordinate_initialization(allocation)
-
-    if len(allocation.hostnames) == 1:
-        worker = allocation.hostnames[0]
-        run_single_node(worker, allocation, results_dir, test_commands, timestamp)
-    elif len(allocation.hostnames) > 1:
-        run_multiple_nodes(allocation, results_dir, test_commands, timestamp)
+    if args.resume:
+        # Continue a previous campaign with its saved plan
+        results_dir = args.resume.rstrip("/")
+        plan = load_plan(results_dir)
+        timestamp = plan["timestamp"]
+        LOG.info("Resuming campaign " + timestamp + " from " + results_dir)
     else:
-        LOG.error("Something went wrong. No nodes allocated")
+        # Set up results directory with timestamp
+        LOG.info("Setting up local results directory")
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H:%M:%S")
+        results_dir = timestamp + "_results"
+        execute_local_command(["mkdir", results_dir])
+        plan = None
+
+    if config.orchestrator == "asyncio":
+        # Initialize and run all nodes from a single event loop
+        orchestrator = AsyncOrchestrator(allocation, results_dir, timestamp, plan=plan)
+        if config.pipelined:
+            asyncio.run(orchestrator.run_pipelined())
+        else:
+            asyncio.run(orchestrator.run())
+    elif config.pipelined:
+        # Each node starts its runs as soon as it is initialized
+        run_pipelined(allocation, results_dir, timestamp, plan=plan)
+    else:
+        # Initialize each node and retrieve list of commands to run tests
+        test_commands = coordinate_initialization(allocation, results_dir)
+        if plan is None:
+            plan = make_plan(test_commands, allocation.hostnames, timestamp)
+            save_plan(plan, results_dir)
+        elif plan["tests"] != test_commands:
+            LOG.warning("Test commands reported by the worker differ from the saved plan. "
+                        "Continuing with the saved plan.")
+
+        lanes = assign_lanes(plan, results_dir, allocation.hostnames)
+        monitor = make_monitor(plan, results_dir)
+        if len(lanes) == 1:
+            worker, lane = next(iter(lanes.items()))
+            run_single_node(worker, allocation, results_dir, plan, lane, monitor=monitor)
+        elif len(lanes) > 1:
+            run_multiple_nodes(allocation, results_dir, plan, lanes, monitor=monitor)
+        else:
+            LOG.info("No runs left to execute in this campaign")
+        save_convergence(monitor, plan, results_dir)
+
+    # Per-node result files are written once, from the journals
+    materialize_journals(results_dir)
     # Save all results to single file
-    all_tests = concat_results(results_dir, timestamp,
-                '*_test_results.csv', "_all_test_results.csv")
-    all_runs = concat_results(results_dir, timestamp,
-                '*_run_results.csv', "_all_run_results.csv")
+    fmt = resolve_format(config.results_format)
+    all_tests = concat_results(results_dir, timestamp, '*_test_results' + FORMATS[fmt],
+                "_all_test_results", fmt, kind="test")
+    all_runs = concat_results(results_dir, timestamp, '*_run_results' + FORMATS[fmt],
+                "_all_run_results", fmt, kind="run")
     all_envs = concat_results(results_dir, timestamp,
-                '*_env_out.csv', "_all_env_out.csv")
+                '*_env_out.csv', "_all_env_out", fmt)
 
     # Run statistical analysis
-    run_stats(all_tests, results_dir, timestamp)
+    run_stats(all_tests, results_dir, timestamp, measures=config.stats_measures)
+
+    # Add the campaign to the index of all campaigns
+    if config.campaign_index:
+        try:
+            index_campaign(results_dir, db_path=config.campaign_index)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            LOG.error("Could not add the campaign to the index: " + str(e))
 
     # Releasing allocated resources
     release_resources_wrapper(args, allocation)
@@ -721,6 +1729,3 @@ def main():
 ######################################
 if __name__ == "__main__":
     main()
-else:
-    print("Error, cannot enter main, exiting.")
-    sys.exit(2)
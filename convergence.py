@@ -0,0 +1,159 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+from toolstats import get_ci_case, get_distribution
+from stats_engine import CumulativeQuantiles
+from results_io import result_values
+
+class ConvergenceMonitor():
+    """ Sequential stopping rule for a campaign.
+
+    Collects the result of every test after each run and re-evaluates, for
+    each test, the nonparametric CI of the p-quantile for fixed and random
+    orders (see toolstats.get_ci) and the Kruskal-Wallis outcome. A test that
+    reports several values (see results_io.expand_results) is evaluated for
+    each of them, named after 'value_names' ({test: [names]}) when the test
+    does not name them itself. A value is decided once both CIs are narrower
+    than 'rel_width' relative to their quantile, or once its CI overlap case
+    and KW outcome have not changed for 'stable_evals' consecutive
+    evaluations; a test is decided once all its values are. A test that has
+    reported no numeric value after 'min_runs' runs of each order is left
+    out of the stopping rule. The campaign is done when every test is
+    decided. Shared by all nodes, so every method is thread-safe.
+    """
+    def __init__(self, tests, rel_width=0.02, min_runs=10, stable_evals=5,
+                 alpha=0.95, p=0.5, value_names=None):
+        self.tests = list(tests)
+        self.rel_width = rel_width
+        self.min_runs = min_runs
+        self.stable_evals = stable_evals
+        self.p = p
+        self.value_names = value_names if value_names is not None else {}
+        # Same Bonferroni correction as toolstats.CI_fixed_vs_random
+        self.alpha = 1 - (1 - alpha) / max(len(self.tests), 1)
+        # Values of each test by name (None for a single plain value), kept
+        # sorted as results come in, so evaluations do not re-sort them
+        self.values = {t: {} for t in self.tests}
+        self.n_runs = {t: {"fixed": 0, "random": 0} for t in self.tests}
+        self.history = {}
+        self.value_decided = {}
+        self.decided = {}
+        self.n_evals = 0
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        with self._lock:
+            return len(self.decided) == len(self.tests)
+
+    def add_run(self, order, results):
+        """ Adds the results of one run, given as {test: result}. Values of a
+        result that are not numbers are ignored.
+        """
+        with self._lock:
+            for test, result in results.items():
+                if test not in self.values:
+                    continue
+                self.n_runs[test][order] += 1
+                for name, value in result_values(result, self.value_names.get(test)):
+                    if name not in self.values[test]:
+                        self.values[test][name] = {"fixed": CumulativeQuantiles(alpha=self.alpha),
+                                                   "random": CumulativeQuantiles(alpha=self.alpha)}
+                    self.values[test][name][order].add(value)
+
+    def evaluate(self):
+        """ Re-evaluates every undecided test and returns the list of tests
+        decided by this evaluation.
+        """
+        newly_decided = []
+        with self._lock:
+            self.n_evals += 1
+            for test in self.tests:
+                if test in self.decided:
+                    continue
+                if not self.values[test]:
+                    if min(self.n_runs[test].values()) >= self.min_runs:
+                        self.decided[test] = {"reason": "no_numeric_result",
+                                              "evaluation": self.n_evals}
+                        newly_decided.append(test)
+                    continue
+                for name in self.values[test]:
+                    if (test, name) not in self.value_decided:
+                        self._update_value(test, name)
+                if all((test, name) in self.value_decided for name in self.values[test]):
+                    # The test is decided by the last of its values to be
+                    self.decided[test] = max((self.value_decided[(test, name)]
+                                              for name in self.values[test]),
+                                             key=lambda state: state["evaluation"])
+                    newly_decided.append(test)
+        return newly_decided
+
+    def _update_value(self, test, name):
+        state = self._evaluate_value(test, name)
+        if state is None:
+            return
+        history = self.history.setdefault((test, name), [])
+        history.append(state)
+        reason = None
+        if state["fixed_rel_width"] <= self.rel_width and \
+                state["random_rel_width"] <= self.rel_width:
+            reason = "ci_width"
+        elif len(history) >= self.stable_evals and \
+                len({(h["ci_case"], h["KW_dist_type"])
+                     for h in history[-self.stable_evals:]}) == 1:
+            reason = "stable_case"
+        if reason is not None:
+            self.value_decided[(test, name)] = dict(state, reason=reason,
+                                                    evaluation=self.n_evals)
+
+    def _evaluate_value(self, test, name):
+        fixed = self.values[test][name]["fixed"]
+        random = self.values[test][name]["random"]
+        if len(fixed) < self.min_runs or len(random) < self.min_runs:
+            return None
+
+        f_m, f_lo, f_hi = (x[0] for x in fixed.quantile_cis([self.p]))
+        r_m, r_lo, r_hi = (x[0] for x in random.quantile_cis([self.p]))
+        case, _ = get_ci_case(f_m, f_lo, f_hi, r_m, r_lo, r_hi)
+        try:
+            kw_dist = get_distribution(stats.kruskal(fixed.sorted, random.sorted)[1])
+        except ValueError:
+            # All values identical
+            kw_dist = 'same'
+        return {"n_fixed": len(fixed),
+                "n_random": len(random),
+                "fixed_rel_width": relative_width(f_m, f_lo, f_hi),
+                "random_rel_width": relative_width(r_m, r_lo, r_hi),
+                "ci_case": case,
+                "KW_dist_type": kw_dist}
+
+    def to_frame(self, test_names=None):
+        """ Returns the decision state of every value of every test, with the
+        value's name in 'metric' (empty for a single plain value)
+        """
+        rows = []
+        with self._lock:
+            for test in self.tests:
+                for name in list(self.values[test]) or [None]:
+                    row = {"test_number": test,
+                           "metric": name,
+                           "decided": test in self.decided or (test, name) in self.value_decided}
+                    if test_names is not None:
+                        row["test_command"] = test_names[test]
+                    if (test, name) in self.value_decided:
+                        row.update(self.value_decided[(test, name)])
+                    elif test in self.decided and not self.values[test]:
+                        row.update(self.decided[test])
+                    elif self.history.get((test, name)):
+                        row.update(self.history[(test, name)][-1])
+                    rows.append(row)
+        return pd.DataFrame(rows)
+
+def relative_width(q, lo, hi):
+    """ Width of the CI [lo, hi] relative to the magnitude of its quantile q """
+    if q == 0:
+        return 0.0 if hi == lo else np.inf
+    return (hi - lo) / abs(q)
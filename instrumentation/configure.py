@@ -1,7 +1,12 @@
 from importlib import import_module
-from scp import SCPClient
+import os
+import glob
+import shlex
 
-from importlib import import_module
+import numpy as np
+import pandas as pd
+
+from journal import read_journal
 
 
 def configure_instr_module(ssh_execute, module_name, env_dict, log):
@@ -18,20 +23,68 @@ def configure_instr_module(ssh_execute, module_name, env_dict, log):
         env_dict["INSTRUMENT"] = intrumentation_wrapper
 
 
-def setup_env_file(ssh, env_dict):
-    with open("temp_env.txt", "w") as fp:
+def env_exports(env_dict):
+    """ Returns a shell snippet exporting every variable in env_dict. Used to
+    deliver per-test variables inline with the test command itself.
+    """
+    return "".join("export " + key + "=" + shlex.quote(str(value)) + "; "
+                   for key, value in env_dict.items())
+
+
+def setup_env_file(session, env_dict, remote_path="instr_env.txt"):
+    """ Writes the static instrumentation environment to ~/instr_env.txt on
+    the worker through the session's file access (SFTP with the SSH backend).
+    Only needs to be called once per boot; per-test variables are passed with
+    env_exports().
+    """
+    with session.open_file(remote_path, "w") as fp:
         for key, value in env_dict.items():
+            # Double quotes so that e.g. $HOME in wrapper paths expands on the worker
             fp.write("export " + key + "=" + "\"%s\"" % value + "\n")
-    scp = SCPClient(ssh.get_transport())
-    scp.put("temp_env.txt", "~/instr_env.txt")
 
 
-def pull_results(ssh, module_name, result_dir, log):
+def results_location(module_name):
+    """ Returns the path of the module's outputs on the worker node, or None
+    if the module does not produce any.
+    """
     config = import_module("instrumentation." + module_name + ".config")
-    if hasattr(config, "results_location"):
-        log.info("Pulling results from " + config.results_location)
-        scp = SCPClient(ssh.get_transport())
-        try:
-            scp.get(config.results_location, result_dir, recursive=True)
-        except Exception as e:
-            log.error("Failed to pull results for %s" % module_name)
+    return getattr(config, "results_location", None)
+
+
+def load_results(module_name, results_dir):
+    """ Loads the per-test records of a module (its config's results_file,
+    in JSON lines) pulled from every worker into results_dir. Returns one row
+    per (run_uuid, test_number) with a numeric column per measure, named
+    <module>.<measure>, or None if the module records no per-test results.
+    Measures are the fields under the config's results_field; nested fields
+    are joined with dots and a trailing ".value" is dropped.
+    """
+    config = import_module("instrumentation." + module_name + ".config")
+    if not hasattr(config, "results_file"):
+        return None
+    pattern = os.path.join(results_dir, "*_" + os.path.basename(config.results_location.rstrip("/")),
+                           config.results_file)
+    records = [r for path in sorted(glob.glob(pattern)) for r in read_journal(path)]
+    if not records:
+        return None
+
+    df = pd.json_normalize(records, sep=".").rename(columns={"test_id": "test_number"})
+    df = df.dropna(subset=["run_uuid", "test_number"])
+    prefix = config.results_field + "." if hasattr(config, "results_field") else ""
+    columns = [c for c in df.columns if c.startswith(prefix)
+               and c not in ("run_uuid", "test_number", "timestamp", "order")]
+    measures = df[columns].apply(pd.to_numeric, errors="coerce")
+    # Drop text fields (e.g. units), but keep measures that were never counted
+    measures = measures.loc[:, measures.notna().any() | df[columns].isna().all()]
+    names = {}
+    for c in measures.columns:
+        name = c[len(prefix):]
+        if name.endswith(".value"):
+            name = name[:-len(".value")]
+        names[c] = module_name + "." + name
+    measures = measures.rename(columns=names)
+
+    measures.insert(0, "run_uuid", df["run_uuid"].astype(str))
+    measures.insert(1, "test_number", df["test_number"].astype(np.int64))
+    # A test re-run after an interruption has a new run_uuid, keep the last record
+    return measures.drop_duplicates(subset=["run_uuid", "test_number"], keep="last")
@@ -5,6 +5,9 @@ Configure Perf Instrumentation
 init_script_call = "cd instrumentation/perf && bash perf_setup.sh"
 wrapper_script = "/bin/bash $HOME/instrumentation/perf/perf_wrapper.sh"
 results_location = "~/perf_results"
+# Per-test records merged with the test results (see configure.load_results)
+results_file = "perf_stats.jsonl"
+results_field = "counters"
 
 perf_counters = "task-clock, duration_time, cycles, inst_retired.any, bus-cycles, cache-misses," \
     "cache-references, branch-misses, mem-loads, mem-stores, LLC-load-misses, LLC-store-misses," \
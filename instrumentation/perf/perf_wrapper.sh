@@ -1,6 +1,6 @@
 #!/bin/bash
 
-if [[ -z "${PERF_COUNTERS_STR}" ]]; then
+if [[ -n "${PERF_COUNTERS_STR}" ]]; then
 	IFS=', ' read -r -a perf_counters <<< "$PERF_COUNTERS_STR"
 else
   declare -a perf_counters=("task-clock" "duration_time" "cycles" "inst_retired.any" "bus-cycles" "cache-misses" "cache-references" "branch-misses" "mem-loads" "mem-stores" "LLC-load-misses" "LLC-store-misses" "L1-dcache-load-misses" "L1-icache-load-misses" "dTLB-load-misses" "dTLB-store-misses" "page-faults" "alignment-faults" "context-switches" "cpu-migrations" "major-faults" "minor-faults" "branch-load-misses" "iTLB-load-misses" "node-store-misses" "node-load-misses")
@@ -12,20 +12,24 @@ mkdir -p $HOME/perf_results
 echo "Running task with perf instrumentation."
 echo "Modified command is: 'sudo perf stat -x, -o $HOME/perf_results/perf.txt -e ${strcounters%,} -- $@'"
 sudo perf stat -x, -o $HOME/perf_results/perf.txt -e ${strcounters%,} -- "$@"
+rc=$?
 
-header="run_uuid,timestamp"
+# Parse perf's CSV output (value,unit,event,run time,percentage,...) in a
+# single pass into one JSON record per test, with every counter's value,
+# unit and multiplexing percentage. Counters that were not counted or not
+# supported get a null value.
+awk -F, -v run_id="${RUN_ID}" -v timestamp="${TIMESTAMP}" -v order="${ORDER}" -v test_num="${TEST_NUM}" '
+function str(s) { gsub(/\\/, "\\\\", s); gsub(/"/, "\\\"", s); return "\"" s "\"" }
+function num(s) { return (s ~ /^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$/) ? s : "null" }
+/^#/ || NF < 3 { next }
+{
+	counters = counters sep str($3) ":{\"value\":" num($1) ",\"unit\":" str($2) \
+		",\"run_time\":" num($4) ",\"pct\":" num($5) "}"
+	sep = ","
+}
+END {
+	print "{\"run_uuid\":" str(run_id) ",\"timestamp\":" str(timestamp) ",\"order\":" str(order) \
+		",\"test_id\":" num(test_num) ",\"counters\":{" counters "}}"
+}' $HOME/perf_results/perf.txt >> $HOME/perf_results/perf_stats.jsonl
 
-line="${RUN_ID},${TIMESTAMP}"
-for val in ${perf_counters[@]}; do
-	line="${line},$(grep \,${val} $HOME/perf_results/perf.txt | cut -d, -f 1,5 )"
-	header="${header},${val},${val} Percentage"
-done
-
-header="${header},order,test_id"
-
-pfilename="perf_stats.csv"
-if [[ ! -f $HOME/perf_results/$pfilename ]]; then
-    echo "$header" > $HOME/perf_results/$pfilename
-fi
-line="${line},${ORDER},${TEST_NUM}"
-echo "$line" >> $HOME/perf_results/$pfilename
\ No newline at end of file
+exit $rc
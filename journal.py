@@ -0,0 +1,104 @@
+import os
+import json
+import logging
+from time import monotonic
+
+import pandas as pd
+
+LOG = logging.getLogger("main")
+
+class ResultJournal():
+    """ Append-only JSON Lines journal of result records for a single node.
+
+    Each record is written as one line as soon as it is produced, so the cost
+    of saving a record does not grow with the number of records already
+    saved. Writes are flushed and fsync'ed in batches (every 'sync_every'
+    records or 'sync_interval' seconds, whichever comes first) and on
+    sync()/close(). The full table is materialized once with to_frame().
+    A partial last line left by a crash is cut off when the journal is
+    reopened, so records appended after a resume start on a line of their own.
+    """
+    def __init__(self, path, columns, sync_every=20, sync_interval=10.0):
+        self.path = path
+        self.columns = list(columns)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._pending = 0
+        self._last_sync = monotonic()
+        truncate_partial_line(path)
+        self._fp = open(path, "a")
+
+    def append(self, record):
+        """ Appends a record, given either as a dict or as a list of values
+        in the order of the journal's columns.
+        """
+        if not isinstance(record, dict):
+            record = dict(zip(self.columns, record))
+        self._fp.write(json.dumps(record, default=str) + "\n")
+        self._pending += 1
+        if (self._pending >= self.sync_every or
+                monotonic() - self._last_sync >= self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        """ Flushes buffered records and forces them to disk """
+        if self._fp.closed:
+            return
+        self._fp.flush()
+        if self._pending:
+            os.fsync(self._fp.fileno())
+        self._pending = 0
+        self._last_sync = monotonic()
+
+    def close(self):
+        if not self._fp.closed:
+            self.sync()
+            self._fp.close()
+
+    def records(self):
+        """ Returns all records stored in the journal as a list of dicts """
+        self.sync()
+        return read_journal(self.path)
+
+    def to_frame(self):
+        """ Materializes the journal as a DataFrame with the journal's columns """
+        return pd.DataFrame(self.records(), columns=self.columns)
+
+def truncate_partial_line(path, chunk_size=4096):
+    """ Cuts a journal file back to its last complete line, dropping what a
+    crash left of a record being written
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(pos - chunk_size, 0)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+
+def read_journal(path, log=None):
+    """ Reads a journal file. Lines that are not valid records, e.g. a
+    partially written line left by a crash of the controller, are skipped
+    with a warning.
+    """
+    if log is None:
+        log = LOG
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                log.warning("Skipping invalid record on line " + str(n) + " of " + path)
+    return records
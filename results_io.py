@@ -0,0 +1,193 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger("main")
+
+# Optional dependency for the parquet format
+try:
+    import pyarrow
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet"}
+
+# Column types of the result tables. Columns not listed here (e.g. the
+# measures of instrumentation modules) keep the type pandas gives them.
+TEST_RESULT_SCHEMA = {"run_uuid": str,
+                      "hostname": "category",
+                      "run_num": np.int64,
+                      "total_runs": np.int64,
+                      "test_command": "category",
+                      "test_number": np.int64,
+                      "order_number": np.int64,
+                      "order_type": "category",
+                      "time_start": np.float64,
+                      "time_stop": np.float64,
+                      "completion_status": "category",
+                      "result": np.float64,
+                      "controller_duration": np.float64,
+                      "remote_duration": np.float64}
+RUN_RESULT_SCHEMA = {"run_uuid": str,
+                     "hostname": "category",
+                     "run_num": np.int64,
+                     "total_runs": np.int64,
+                     "order_type": "category",
+                     "random_seed": np.float64,
+                     "time_start": np.float64,
+                     "time_stop": np.float64,
+                     "reset_latency": np.float64}
+SCHEMAS = {"test": TEST_RESULT_SCHEMA, "run": RUN_RESULT_SCHEMA}
+
+def resolve_format(fmt, log=None):
+    """ Returns the format results can actually be saved in: parquet falls
+    back to csv when pyarrow is not installed.
+    """
+    if log is None:
+        log = LOG
+    if fmt not in FORMATS:
+        raise ValueError("Unknown results format: " + str(fmt))
+    if fmt == "parquet" and not HAVE_PYARROW:
+        log.warning("pyarrow is not installed, saving results as csv instead of parquet")
+        return "csv"
+    return fmt
+
+def apply_schema(df, kind):
+    """ Casts the columns of a 'test' or 'run' results table to their types.
+    Results are stored as floats; results that are not a single number
+    (e.g. multi-value results) are kept as text in a 'result_raw' column.
+    """
+    df = df.copy()
+    if kind == "test" and "result" in df.columns and \
+            not pd.api.types.is_numeric_dtype(df["result"]):
+        result = pd.to_numeric(df["result"], errors="coerce")
+        not_float = df["result"].notna() & result.isna()
+        if not_float.any():
+            df["result_raw"] = df["result"].where(not_float).astype(object)
+        df["result"] = result
+    for column, dtype in SCHEMAS[kind].items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def save_table(df, path, fmt="csv"):
+    """ Saves a results table to 'path' (without extension) in the given
+    format and returns the path of the file written.
+    """
+    path = path + FORMATS[fmt]
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+def load_table(path, kind=None):
+    """ Loads a results table saved as csv or parquet, based on the file's
+    extension. A csv table of a known 'kind' is given the typed schema.
+    """
+    if os.path.splitext(path)[1] == FORMATS["parquet"]:
+        return pd.read_parquet(path)
+    df = pd.read_csv(path)
+    if kind is not None:
+        df = apply_schema(df, kind)
+    return df
+
+def expand_results(data, result_names=None, command="test_command"):
+    """ Splits results made of several values into one row per value.
+
+    A test reports several metrics by writing them separated by commas (or
+    on separate lines), either as name=value pairs or as plain values whose
+    names are listed in 'result_names', a dict mapping a substring of test
+    commands to the names of their values in order. Values without a name
+    are numbered. Every value becomes a row of its own, with the metric's
+    name appended to the test command ('<command> -- <name>').
+    """
+    if result_names is None:
+        result_names = {}
+    data = data.reset_index(drop=True)
+    if "result_raw" in data.columns:
+        text = data["result_raw"]
+    elif not pd.api.types.is_numeric_dtype(data["result"]):
+        text = data["result"]
+    else:
+        return data
+    text = text.where(text.notna(), "").astype(str)
+    multi = text.str.contains(",|=", regex=True)
+    if not multi.any():
+        return data
+
+    expanded = data[multi].copy()
+    expanded["_position"] = data.index[multi]
+    expanded["_value"] = text[multi].str.split(",")
+    expanded = expanded.explode("_value")
+    expanded["_value"] = expanded["_value"].str.strip()
+    expanded = expanded[expanded["_value"] != ""]
+    index = expanded.groupby("_position").cumcount().to_numpy()
+
+    # Named values (name=value) first, then names from result_names, then numbers
+    pairs = expanded["_value"].str.split("=", n=1)
+    named = pairs.str.len() == 2
+    names = pd.Series(np.where(named, pairs.str[0].str.strip(), None),
+                      index=expanded.index, dtype=object)
+    commands = expanded[command].astype(str)
+    for pattern, value_names in result_names.items():
+        lookup = np.array(list(value_names) + [None], dtype=object)
+        todo = names.isna() & commands.str.contains(pattern, regex=False)
+        names[todo] = lookup[np.minimum(index, len(value_names))][todo.to_numpy()]
+    names = names.where(names.notna(), pd.Series(index.astype(str), index=expanded.index))
+
+    expanded[command] = commands + " -- " + names
+    expanded["result"] = pd.to_numeric(pairs.str[-1].str.strip(), errors="coerce")
+    if "result_raw" in expanded.columns:
+        expanded["result_raw"] = None
+
+    single = data[~multi].copy()
+    single["_position"] = single.index
+    if not pd.api.types.is_numeric_dtype(single["result"]):
+        single["result"] = pd.to_numeric(single["result"], errors="coerce")
+    if isinstance(single[command].dtype, pd.CategoricalDtype):
+        single[command] = single[command].astype(str)
+    # Keep the rows in their original order
+    out = pd.concat([single, expanded.drop(columns="_value")])
+    out = out.sort_values("_position", kind="stable").drop(columns="_position")
+    return out.reset_index(drop=True)
+
+def value_names(test_command, result_names):
+    """ Names of the values of 'test_command' in 'result_names' (see
+    expand_results), None if no pattern matches it
+    """
+    for pattern, names in (result_names or {}).items():
+        if pattern in str(test_command):
+            return list(names)
+    return None
+
+def result_values(result, names=None):
+    """ Splits the result of one test into (name, value) pairs, named the
+    way expand_results names them, with the names of plain values given by
+    'names'. A single plain value is named None. Values that are not finite
+    numbers are skipped.
+    """
+    if result is None or (not isinstance(result, str) and pd.isna(result)):
+        return []
+    if not isinstance(result, str):
+        result = str(result)
+    parts = [p.strip() for p in result.split(",") if p.strip()]
+    values = []
+    for i, part in enumerate(parts):
+        if "=" in part:
+            name, value = [x.strip() for x in part.split("=", 1)]
+        elif len(parts) == 1:
+            name, value = None, part
+        else:
+            name = names[i] if names is not None and i < len(names) else str(i)
+            value = part
+        try:
+            value = float(value)
+        except ValueError:
+            continue
+        if np.isfinite(value):
+            values.append((name, value))
+    return values
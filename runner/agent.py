@@ -0,0 +1,73 @@
+""" Runs a whole ordered run of tests on the worker node in one invocation.
+
+Usage: python3 agent.py < run.json
+
+The run is read from stdin as a JSON object:
+    {"directory": dir the tests are run from,
+     "results_file": file the tests append their results to,
+     "env": variables exported to every test,
+     "tests": [[test_number, command], ...] in the order to run them}
+
+Tests are run back to back with /bin/bash -c, each with TEST_NUM added to
+its environment. Everything is reported on stdout as JSON lines: the output
+of the tests as {"type": "output", ...} records and, as soon as each test
+finishes, a {"type": "test", ...} record with its status, timings (wall
+clock start/stop and a monotonic duration, in seconds) and result. A test's
+result is the lines it appended to the results file, or the lines it printed
+prefixed with RESULT_MARKER.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+RESULT_MARKER = "@@ordersage-result@@ "
+
+def emit(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+def read_lines(path):
+    try:
+        with open(path) as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+def run_test(test, cmd, directory, results_file, env):
+    n_lines = len(read_lines(results_file))
+    values = []
+    start = time.time()
+    start_ns = time.monotonic_ns()
+    proc = subprocess.Popen(["/bin/bash", "-c", "cd " + directory + " && " + cmd],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            env=dict(env, TEST_NUM=str(test)))
+    for line in proc.stdout:
+        line = line.decode("utf-8", errors="replace").rstrip("\n")
+        if line.startswith(RESULT_MARKER):
+            values.append(line[len(RESULT_MARKER):].strip())
+        else:
+            emit({"type": "output", "test": test, "line": line})
+    rc = proc.wait()
+    duration = (time.monotonic_ns() - start_ns) / 1e9
+    stop = time.time()
+    values.extend(x.strip() for x in read_lines(results_file)[n_lines:])
+    return {"type": "test", "test": test,
+            "status": "Success" if rc == 0 else "Failure",
+            "exit_status": rc, "time_start": start, "time_stop": stop,
+            "duration": duration,
+            "result": ",".join(values) if values else None}
+
+def main():
+    run = json.load(sys.stdin)
+    directory = os.path.expanduser(run["directory"])
+    results_file = os.path.expandvars(os.path.expanduser(run["results_file"]))
+    env = dict(os.environ)
+    env.update({k: str(v) for k, v in run["env"].items()})
+    for test, cmd in run["tests"]:
+        emit(run_test(test, cmd, directory, results_file, env))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+import io
+import os
+import shutil
+import logging
+import socket
+import subprocess
+from time import sleep, monotonic
+
+import paramiko
+from scp import SCPClient
+
+LOG = logging.getLogger("main")
+
+# Execution backends. A session gives the controller access to one worker:
+#  - open_channel(): a paramiko-like channel to run one command on the worker
+#  - put() / get() / open_file(): file transfers
+#  - reset(): brings the worker back to a clean state, returns its latency
+#  - connect() / invalidate() / close(): connection management
+# WorkerSession reaches the worker over SSH, LocalSession runs it in a
+# directory of the controller host.
+
+class WorkerSession():
+    """ Long-lived SSH session to a single worker node.
+
+    Owns the paramiko client and its transport, and lazily creates (then
+    reuses) the SCP and SFTP handles on top of that transport. Every accessor
+    checks that the transport is still alive and transparently reconnects if
+    it is not, so callers can keep using the same session across reboots of
+    the worker triggered by reset().
+    """
+    # Commands run on the worker node, not on the controller machine
+    isolated = True
+
+    def __init__(self, worker, allocation, log=None, port_num=22, timeout=25,
+                 max_tries=10, keepalive=30):
+        self.worker = worker
+        self.allocation = allocation
+        self.log = log if log is not None else LOG
+        self.port_num = port_num
+        self.timeout = timeout
+        self.max_tries = max_tries
+        self.keepalive = keepalive
+        self.n_connects = 0
+        self._client = None
+        self._scp = None
+        self._sftp = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self, max_tries=None):
+        """ Opens a fresh connection to the worker, retrying up to max_tries
+        times (defaults to the session's max_tries). Any previous connection
+        and its handles are discarded first.
+        """
+        if max_tries is None:
+            max_tries = self.max_tries
+        self.close()
+        self.log.info("Starting ssh connection to " + self.worker)
+        n_tries = 0
+        while True:
+            client = paramiko.SSHClient()
+            client.load_system_host_keys()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                sock = socket.create_connection((self.worker, self.port_num), timeout=self.timeout)
+                # Every command sends a few small packets in a row, which
+                # Nagle's algorithm would hold back for the server's delayed ACK
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                client.connect(hostname = self.worker, port = self.port_num,
+                               username = self.allocation.user,
+                               key_filename = self.allocation.public_key,
+                               timeout = self.timeout, sock = sock)
+            except Exception as e:
+                client.close()
+                n_tries += 1
+                self.log.error("In WorkerSession.connect: " + repr(e) + " - " + str(e))
+                self.log.info("Error #" + str(n_tries) + " of " + str(max_tries) + ".")
+                if n_tries >= max_tries:
+                    self.log.error("Failure to connect to " + self.worker)
+                    raise
+                self.log.info("Retrying...")
+                sleep(self.timeout)
+            else:
+                break
+
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        self._client = client
+        self.n_connects += 1
+        self.log.info("SSH connection to " + self.worker + " successful.")
+        return self
+
+    def is_alive(self):
+        """ Returns True if the underlying transport is connected and active """
+        if self._client is None:
+            return False
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def ssh_banner_ready(self, timeout=5):
+        """ Returns True if the worker's SSH server accepts a TCP connection
+        and sends its protocol banner. Cheaper than a full login, so it is
+        used to poll for a node coming back from a reboot.
+        """
+        try:
+            with socket.create_connection((self.worker, self.port_num), timeout=timeout) as sock:
+                sock.settimeout(timeout)
+                return sock.recv(64).startswith(b"SSH-")
+        except OSError:
+            return False
+
+    def ensure_connected(self):
+        """ Reconnects if the transport has gone away (e.g. after a reboot) """
+        if not self.is_alive():
+            if self._client is not None:
+                self.log.info("SSH session to " + self.worker + " is no longer active, reconnecting...")
+            self.connect()
+        return self
+
+    def invalidate(self):
+        """ Drops the current connection without reconnecting. Used when the
+        worker is known to be going away, e.g. right after issuing a reboot.
+        """
+        self.close()
+
+    @property
+    def client(self):
+        self.ensure_connected()
+        return self._client
+
+    @property
+    def transport(self):
+        return self.client.get_transport()
+
+    @property
+    def scp(self):
+        self.ensure_connected()
+        if self._scp is None:
+            self._scp = SCPClient(self._client.get_transport())
+        return self._scp
+
+    @property
+    def sftp(self):
+        self.ensure_connected()
+        if self._sftp is None:
+            self._sftp = self._client.open_sftp()
+        return self._sftp
+
+    def open_channel(self):
+        """ Opens a new session channel on the shared transport """
+        return self.transport.open_session()
+
+    def put(self, local_path, remote_path, recursive=False):
+        self.scp.put(local_path, remote_path, recursive=recursive)
+
+    def get(self, remote_path, local_path, recursive=False):
+        self.scp.get(remote_path, local_path, recursive=recursive)
+
+    def open_file(self, remote_path, mode="r"):
+        return self.sftp.open(remote_path, mode)
+
+    def read_boot_id(self):
+        """ Returns the kernel's boot_id for the worker node, which changes on
+        every boot, or None if it cannot be read.
+        """
+        try:
+            _, stdout, _ = self.client.exec_command("cat /proc/sys/kernel/random/boot_id",
+                                                    timeout=self.timeout)
+            return stdout.read().decode().strip() or None
+        except Exception:
+            return None
+
+    def reset(self, timeout=600, poll_interval=1, max_poll_interval=10):
+        """ Reboots the worker node then polls, with exponential backoff, until
+        it is back up: the SSH banner must be served, a login must succeed and
+        the kernel's boot_id must differ from the one read before the reboot.
+        Returns the reset latency in seconds. The session is left connected
+        to the freshly booted node.
+        """
+        old_boot_id = self.read_boot_id()
+        if old_boot_id is None:
+            self.log.warning("Unable to read boot_id of " + self.worker +
+                             ", reboot completion will not be verified.")
+
+        self.log.info("Rebooting...")
+        reset_start = monotonic()
+        try:
+            _, stdout, _ = self.client.exec_command("sudo reboot", timeout=self.timeout)
+            stdout.channel.recv_exit_status()
+        except Exception:
+            self.log.info('Exception on sudo reboot... assuming reboot in progress')
+        self.invalidate()
+
+        # Spin until the node comes up on a new boot and is ready for SSH
+        self.log.info("Awaiting completion of reboot for " + self.worker + "...")
+        deadline = reset_start + timeout
+        delay = poll_interval
+        n_tries = 0
+        while True:
+            n_tries += 1
+            if self.ssh_banner_ready():
+                try:
+                    self.connect(max_tries=1)
+                except Exception as ex:
+                    self.log.debug("Login to " + self.worker + " not ready yet: " + repr(ex))
+                else:
+                    boot_id = self.read_boot_id()
+                    if old_boot_id is None or (boot_id is not None and boot_id != old_boot_id):
+                        break
+                    # Still logged into the old boot, the reboot has not started yet
+                    self.invalidate()
+
+            if monotonic() + delay > deadline:
+                self.log.critical("Failed to reconnect to " + self.worker + " after "
+                                  + str(timeout) + " seconds")
+                raise RuntimeError("Reset of " + self.worker + " timed out")
+            self.log.debug("Node " + self.worker + " not ready (poll " + str(n_tries)
+                           + "), retrying in " + str(delay) + " seconds...")
+            sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+
+        return monotonic() - reset_start
+
+    def close(self):
+        for handle in (self._scp, self._sftp, self._client):
+            if handle is None:
+                continue
+            try:
+                handle.close()
+            except Exception:
+                pass
+        self._scp = None
+        self._sftp = None
+        self._client = None
+
+class LocalChannel():
+    """ Runs a single command of a LocalSession with subprocess, with the
+    subset of the paramiko Channel interface used by the controller.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.combine_stderr = False
+        self._proc = None
+
+    def set_combine_stderr(self, combine):
+        self.combine_stderr = combine
+
+    def exec_command(self, cmd):
+        self._proc = subprocess.Popen(cmd, shell=True, executable="/bin/bash",
+                                      cwd=self.session.home, env=self.session.env(),
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT if self.combine_stderr
+                                      else subprocess.PIPE)
+
+    def recv(self, nbytes):
+        return self._proc.stdout.read1(nbytes)
+
+    def sendall(self, data):
+        self._proc.stdin.write(data)
+        self._proc.stdin.flush()
+
+    def shutdown_write(self):
+        self._proc.stdin.close()
+
+    def makefile(self, mode="r"):
+        if "b" in mode:
+            return self._proc.stdout
+        return io.TextIOWrapper(self._proc.stdout, encoding="utf-8", errors="replace")
+
+    def makefile_stderr(self, mode="r"):
+        if self._proc.stderr is None:
+            return io.BytesIO() if "b" in mode else io.StringIO()
+        if "b" in mode:
+            return self._proc.stderr
+        return io.TextIOWrapper(self._proc.stderr, encoding="utf-8", errors="replace")
+
+    def recv_exit_status(self):
+        return self._proc.wait()
+
+    def close(self):
+        if self._proc is None:
+            return
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        for f in (self._proc.stdin, self._proc.stdout, self._proc.stderr):
+            if f is not None and not f.closed:
+                f.close()
+
+class LocalSession():
+    """ Session to a worker that is a directory of the controller host.
+
+    Commands run as local processes of the controller's user, with the
+    directory as their working directory and $HOME. There is no isolation:
+    this only keeps the files the controller writes (deployment, results)
+    inside the directory, while every command runs directly on the
+    controller machine, even when 'worker' is the root of a container.
+    The controller therefore does not run initialization scripts,
+    env_info.sh or instrumentation modules through it ('isolated' is False).
+    'worker' is either an existing directory or a name, in which case the
+    directory is created under 'root'. Nodes cannot be rebooted, so reset()
+    only reports a zero latency. Useful to run and time the whole controller
+    pipeline on one machine, without network overhead.
+    """
+    # Commands run on the controller machine itself
+    isolated = False
+
+    def __init__(self, worker, allocation=None, log=None, root="~/.ordersage/local"):
+        self.worker = worker
+        self.allocation = allocation
+        self.log = log if log is not None else LOG
+        if os.path.isdir(os.path.expanduser(worker)):
+            self.home = os.path.abspath(os.path.expanduser(worker))
+        else:
+            self.home = os.path.join(os.path.abspath(os.path.expanduser(root)), worker)
+        self.n_connects = 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def env(self):
+        return dict(os.environ, HOME=self.home)
+
+    def path(self, remote_path):
+        """ Returns the local path of a path on the worker """
+        if remote_path == "~" or remote_path.startswith("~/"):
+            remote_path = remote_path[2:]
+        return os.path.join(self.home, remote_path)
+
+    def connect(self, max_tries=None):
+        os.makedirs(self.home, exist_ok=True)
+        self.n_connects += 1
+        self.log.info("Using local directory " + self.home + " as " + self.worker)
+        return self
+
+    def is_alive(self):
+        return os.path.isdir(self.home)
+
+    def ensure_connected(self):
+        return self
+
+    def invalidate(self):
+        pass
+
+    def open_channel(self):
+        return LocalChannel(self)
+
+    def put(self, local_path, remote_path, recursive=False):
+        dest = self.path(remote_path)
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(local_path.rstrip("/")))
+        if recursive and os.path.isdir(local_path):
+            shutil.copytree(local_path, dest, dirs_exist_ok=True)
+        else:
+            shutil.copy(local_path, dest)
+
+    def get(self, remote_path, local_path, recursive=False):
+        src = self.path(remote_path)
+        dest = local_path
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src.rstrip("/")))
+        if recursive and os.path.isdir(src):
+            shutil.copytree(src, dest, dirs_exist_ok=True)
+        else:
+            shutil.copy(src, dest)
+
+    def open_file(self, remote_path, mode="r"):
+        return open(self.path(remote_path), mode)
+
+    def reset(self, **kwargs):
+        self.log.info("Local worker " + self.worker + " cannot be rebooted, skipping reset")
+        return 0.0
+
+    def close(self):
+        pass
@@ -0,0 +1,305 @@
+""" Vectorized statistics over all the groups (test configurations) of a
+campaign at once.
+
+The values of a measure are grouped and sorted a single time; the
+statistics toolstats reports for every group (coefficient of variation,
+Kruskal-Wallis H, quantiles and their confidence intervals, percent
+difference) are then computed on whole arrays instead of group by group.
+Shapiro-Wilk, which has to be computed sample by sample, can be spread over
+a pool of processes that read the sorted values from shared memory.
+"""
+import os
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.stats as stats
+
+ORDERS = ['fixed', 'random']
+# Below this number of samples, starting processes costs more than it saves
+MIN_PARALLEL_SAMPLES = 256
+# Chunks per process, so that processes finishing early pick up more work
+CHUNKS_PER_JOB = 4
+
+def ci_ranks(n, p, alpha=0.95):
+    """ 0-based ranks of the bounds of the nonparametric confidence interval
+    at level 'alpha' of the p-quantile of a sample of size n (Le Boudec,
+    Performance Evaluation of Computer and Communication Systems, p. 36).
+    Works element-wise on arrays of sizes and quantiles.
+    """
+    n = np.asarray(n)
+    p = np.asarray(p, dtype=np.float64)
+    eta = stats.norm.ppf((1 + alpha) / 2.0) # 1.96 for alpha = 0.95
+    spread = eta * np.sqrt(n * p * (1 - p))
+    lo_rank = np.maximum(np.floor(n * p - spread).astype(np.int64), 0)
+    hi_rank = np.minimum(np.ceil(n * p + spread).astype(np.int64) + 1, n - 1)
+    return lo_rank, hi_rank
+
+def quantile_cis(s, ps, alpha=0.95):
+    """ p-quantiles of sample 's' for every p of 'ps', interpolated linearly
+    as np.quantile, with their confidence intervals. All the order
+    statistics needed are placed by a single np.partition of the sample.
+    Returns arrays (quantile, ci_low, ci_high), NaN for an empty sample.
+    """
+    s = np.asarray(s, dtype=np.float64)
+    ps = np.atleast_1d(np.asarray(ps, dtype=np.float64))
+    n = len(s)
+    if n == 0:
+        nan = np.full(len(ps), np.nan)
+        return nan, nan.copy(), nan.copy()
+    pos = ps * (n - 1)
+    q_lo = np.floor(pos).astype(np.int64)
+    q_hi = np.minimum(q_lo + 1, n - 1)
+    lo_rank, hi_rank = ci_ranks(n, ps, alpha)
+    part = np.partition(s, np.unique(np.concatenate([q_lo, q_hi, lo_rank, hi_rank])))
+    q = part[q_lo] + (pos - q_lo) * (part[q_hi] - part[q_lo])
+    return q, part[lo_rank], part[hi_rank]
+
+class CumulativeQuantiles():
+    """ Quantiles and their CIs (see quantile_cis) of a sample that grows
+    as results come in.
+
+    Values are kept sorted by inserting each new one in place (a binary
+    search and a single move of the larger values), so the quantiles after
+    every addition are read off directly instead of re-sorting the whole
+    sample each time.
+    """
+    def __init__(self, alpha=0.95):
+        self.alpha = alpha
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def add(self, value):
+        bisect.insort(self.sorted, float(value))
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+    def quantile_cis(self, ps):
+        """ Same as quantile_cis(sample, ps, alpha) for the current sample """
+        ps = np.atleast_1d(np.asarray(ps, dtype=np.float64))
+        n = len(self.sorted)
+        if n == 0:
+            nan = np.full(len(ps), np.nan)
+            return nan, nan.copy(), nan.copy()
+        pos = ps * (n - 1)
+        q_lo = np.floor(pos).astype(np.int64)
+        q_hi = np.minimum(q_lo + 1, n - 1)
+        lo_rank, hi_rank = ci_ranks(n, ps, self.alpha)
+        s = self.sorted
+        v_lo = np.array([s[i] for i in q_lo])
+        v_hi = np.array([s[i] for i in q_hi])
+        return (v_lo + (pos - q_lo) * (v_hi - v_lo),
+                np.array([s[i] for i in lo_rank]),
+                np.array([s[i] for i in hi_rank]))
+
+def quantile_label(p):
+    """ Column label of a quantile: 0.5 -> 'p50', 0.999 -> 'p99.9' """
+    return 'p' + ('%g' % (p * 100))
+
+class GroupedSamples():
+    """ The values of 'measure' in 'data', grouped by the columns of 'group'
+    and by order type.
+
+    Groups are numbered like df.groupby(group, sort=True) would order them;
+    their keys are in 'keys'. Values are sorted once by group and value, and
+    every (group, order) sample is a contiguous sorted segment of 'sorted'.
+    Per-sample tests run in 'jobs' processes (0 for one per CPU).
+    """
+    def __init__(self, data, group, measure, jobs=1):
+        grouped = data.groupby(group, observed=True, sort=True)
+        codes = grouped.ngroup().to_numpy()
+        self.group = list(group)
+        self.jobs = jobs if jobs > 0 else os.cpu_count()
+        self._shapiro = None
+        self.keys = grouped.size().index.to_frame(index=False)
+        self.n_groups = len(self.keys)
+
+        order_type = data['order_type'].astype(str).to_numpy()
+        keep = (codes >= 0) & np.isin(order_type, ORDERS)
+        codes = codes[keep]
+        is_random = (order_type[keep] == 'random')
+        values = data[measure].to_numpy(dtype=np.float64)[keep]
+
+        # Values sorted by group, then value: the order Kruskal-Wallis ranks in
+        by_value = np.lexsort((values, codes))
+        self.codes = codes[by_value]
+        self.values = values[by_value]
+        self.is_random = is_random[by_value]
+        # The same values, partitioned by order within each group while
+        # staying sorted (stable sort on the segment number)
+        self.segment = self.codes * 2 + self.is_random
+        by_segment = np.argsort(self.segment, kind='stable')
+        self.sorted = self.values[by_segment]
+        n_segments = 2 * self.n_groups
+        counts = np.bincount(self.segment, minlength=n_segments)
+        self.counts = counts.reshape(self.n_groups, 2)
+        self.starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).reshape(self.n_groups, 2)
+
+    def order_index(self, order):
+        return ORDERS.index(order)
+
+    def n(self, order):
+        """ Sample size of every group for the given order type """
+        return self.counts[:, self.order_index(order)]
+
+    def sample(self, g, order):
+        """ Sorted values of group 'g' for the given order type """
+        start = self.starts[g, self.order_index(order)]
+        return self.sorted[start:start + self.counts[g, self.order_index(order)]]
+
+    def mean(self, order):
+        o = self.order_index(order)
+        sums = np.bincount(self.segment, weights=self.values, minlength=2 * self.n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums.reshape(self.n_groups, 2)[:, o] / self.counts[:, o]
+
+    def variation(self, order):
+        """ Coefficient of variation (population std / mean), as scipy.stats.variation """
+        o = self.order_index(order)
+        n_segments = 2 * self.n_groups
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.bincount(self.segment, weights=self.values,
+                                minlength=n_segments) / self.counts.ravel()
+            dev = self.values - means[self.segment]
+            var = np.bincount(self.segment, weights=dev * dev,
+                              minlength=n_segments) / self.counts.ravel()
+            return (np.sqrt(var) / means).reshape(self.n_groups, 2)[:, o]
+
+    def order_statistic(self, order, ranks):
+        """ Value of 0-based rank 'ranks' (one per group) in each group's
+        sorted sample; NaN where the rank is outside the sample.
+        """
+        o = self.order_index(order)
+        n = self.counts[:, o]
+        ranks = np.asarray(ranks)
+        valid = (ranks >= 0) & (ranks < n)
+        idx = self.starts[:, o] + np.where(valid, ranks, 0)
+        out = np.full(self.n_groups, np.nan)
+        out[valid] = self.sorted[idx[valid]]
+        return out
+
+    def quantile(self, order, p):
+        """ p-quantile of every group, interpolated linearly as np.quantile """
+        n = self.n(order)
+        pos = p * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        v_lo = self.order_statistic(order, lo)
+        v_hi = self.order_statistic(order, hi)
+        return v_lo + (pos - lo) * (v_hi - v_lo)
+
+    def quantile_ci(self, order, p, alpha):
+        """ p-quantile of every group with its nonparametric confidence
+        interval at level 'alpha' (see ci_ranks)
+        """
+        lo_rank, hi_rank = ci_ranks(self.n(order), p, alpha)
+        return (self.quantile(order, p),
+                self.order_statistic(order, lo_rank),
+                self.order_statistic(order, hi_rank))
+
+    def quantile_cis(self, order, ps, alpha):
+        """ quantile_ci for every p of 'ps', from the values sorted once.
+        Returns a dict of (quantile, ci_low, ci_high) arrays by p.
+        """
+        return {p: self.quantile_ci(order, p, alpha) for p in ps}
+
+    def kruskal(self):
+        """ Kruskal-Wallis H statistic and p-value comparing the fixed and
+        random samples of every group, with the tie correction of
+        scipy.stats.kruskal. Groups where it is undefined get NaN.
+        """
+        n_total = len(self.values)
+        if n_total == 0:
+            nan = np.full(self.n_groups, np.nan)
+            return nan, nan
+        n_group = np.bincount(self.codes, minlength=self.n_groups)
+        group_start = np.concatenate([[0], np.cumsum(n_group)[:-1]])
+        pos = np.arange(n_total) - group_start[self.codes]
+
+        # Tied values share the average of their ranks
+        new_run = np.ones(n_total, dtype=bool)
+        new_run[1:] = (self.values[1:] != self.values[:-1]) | (self.codes[1:] != self.codes[:-1])
+        run_first = np.flatnonzero(new_run)
+        run_len = np.diff(np.append(run_first, n_total))
+        run_rank = pos[run_first] + (run_len + 1) / 2.0
+        ranks = np.repeat(run_rank, run_len)
+
+        rank_sum_r = np.bincount(self.codes, weights=ranks * self.is_random, minlength=self.n_groups)
+        rank_sum_f = np.bincount(self.codes, weights=ranks, minlength=self.n_groups) - rank_sum_r
+        ties = np.bincount(self.codes[run_first], weights=run_len ** 3.0 - run_len,
+                           minlength=self.n_groups)
+        n_f = self.n('fixed')
+        n_r = self.n('random')
+        n = n_group.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            h = 12.0 / (n * (n + 1)) * (rank_sum_f ** 2 / n_f + rank_sum_r ** 2 / n_r) - 3 * (n + 1)
+            h = h / (1 - ties / (n ** 3 - n))
+        h[(n_f == 0) | (n_r == 0) | ~np.isfinite(h)] = np.nan
+        return h, stats.chi2.sf(h, 1)
+
+    def shapiro(self, order):
+        """ Shapiro-Wilk statistic and p-value of every group's sample (NaN
+        for samples of fewer than 3 values)
+        """
+        if self._shapiro is None:
+            # Both orders are tested at once, in a single pool if parallel
+            w = np.full(2 * self.n_groups, np.nan)
+            p = np.full(2 * self.n_groups, np.nan)
+            counts = self.counts.ravel()
+            tested = np.flatnonzero(counts >= 3)
+            starts = self.starts.ravel()[tested]
+            if self.jobs > 1 and len(tested) >= MIN_PARALLEL_SAMPLES:
+                w[tested], p[tested] = parallel_shapiro(self.sorted, starts, counts[tested],
+                                                        self.jobs)
+            else:
+                w[tested], p[tested] = shapiro_segments(self.sorted, starts, counts[tested])
+            self._shapiro = (w.reshape(self.n_groups, 2), p.reshape(self.n_groups, 2))
+        o = self.order_index(order)
+        return self._shapiro[0][:, o], self._shapiro[1][:, o]
+
+def shapiro_segments(values, starts, counts):
+    """ Shapiro-Wilk statistic and p-value of each segment of 'values' """
+    w = np.empty(len(starts))
+    p = np.empty(len(starts))
+    for i, (start, count) in enumerate(zip(starts, counts)):
+        w[i], p[i] = stats.shapiro(values[start:start + count])
+    return w, p
+
+def shapiro_shared(name, size, starts, counts):
+    """ shapiro_segments on values in the shared memory block 'name' """
+    shm = shared_memory.SharedMemory(name=name)
+    values = np.ndarray((size,), dtype=np.float64, buffer=shm.buf)
+    try:
+        return shapiro_segments(values, starts, counts)
+    finally:
+        # The buffer can only be released once no array uses it
+        del values
+        shm.close()
+
+def parallel_shapiro(values, starts, counts, jobs):
+    """ shapiro_segments split into chunks evaluated by 'jobs' processes.
+    The values are shared read-only with the processes instead of being
+    copied to each of them, and chunks are merged back in their order, so
+    the result does not depend on which process finishes first.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        chunks = np.array_split(np.arange(len(starts)), jobs * CHUNKS_PER_JOB)
+        chunks = [c for c in chunks if len(c)]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(shapiro_shared,
+                                    [shm.name] * len(chunks),
+                                    [len(values)] * len(chunks),
+                                    [starts[c] for c in chunks],
+                                    [counts[c] for c in chunks]))
+    finally:
+        shm.close()
+        shm.unlink()
+    return (np.concatenate([w for w, _ in results]),
+            np.concatenate([p for _, p in results]))
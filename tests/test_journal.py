@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import ResultJournal, read_journal
+
+COLUMNS = ["run_num", "result"]
+
+def test_resume_after_partial_line(tmp_path):
+    path = str(tmp_path / "node_test_journal.jsonl")
+    journal = ResultJournal(path, COLUMNS)
+    journal.append([1, 1.5])
+    journal.append([2, 2.5])
+    journal.close()
+    # Crash while a record was being written
+    with open(path, "a") as f:
+        f.write('{"run_num": 3, "res')
+
+    journal = ResultJournal(path, COLUMNS)
+    journal.append([3, 3.5])
+    journal.append([4, 4.5])
+    journal.close()
+
+    assert read_journal(path) == [{"run_num": 1, "result": 1.5},
+                                  {"run_num": 2, "result": 2.5},
+                                  {"run_num": 3, "result": 3.5},
+                                  {"run_num": 4, "result": 4.5}]
+
+def test_read_skips_invalid_lines(tmp_path):
+    path = str(tmp_path / "node_test_journal.jsonl")
+    with open(path, "w") as f:
+        f.write('{"run_num": 1, "result": 1.5}\n'
+                '{"run_num": 2, "res{"run_num": 3, "result": 3.5}\n'
+                '{"run_num": 4, "result": 4.5}\n')
+
+    assert [r["run_num"] for r in read_journal(path)] == [1, 4]
@@ -5,9 +5,11 @@ import pandas as pd
 import glob
 import datetime
 import statistics as stat
-import scipy.stats as stats
 import itertools
 from logger import configure_logging
+from results_io import load_table, expand_results
+import config
+from stats_engine import GroupedSamples, quantile_cis, quantile_label
 import argparse
 
 LOG = configure_logging(name="toolstats", filter = True, debug = True, \
@@ -16,11 +18,16 @@ LOG = configure_logging(name="toolstats", filter = True, debug = True, \
 def parse_args():
     parser = argparse.ArgumentParser(description='Description of supported command-line arguments:')
     parser.add_argument('-f','--file', type=str, default='',
-                        help='CSV file contaning the results from an execution of controller.py')
+                        help='CSV or parquet file contaning the results from an execution of controller.py')
     parser.add_argument('-d','--results_dir', type=str, default='.',
                         help='Path to save results from toolstats.py')
     parser.add_argument('-t','--test', action='store_true', default=False,
                         help='Run toolstats.py with example dataset')
+    parser.add_argument('-j','--jobs', type=int, default=config.stats_jobs,
+                        help='Number of processes running per-configuration tests (0 for one per CPU)')
+    parser.add_argument('-m','--measures', type=str, default='result',
+                        help='Comma-separated columns to compare between fixed and random orders '
+                             '(e.g. result,perf.cycles)')
 
     args = parser.parse_args()
 
@@ -30,7 +37,9 @@ def parse_args():
 
     return args
 
-def process_data(data):
+def process_data(data, result_names=None):
+    if result_names is None:
+        result_names = config.result_names
     # Remove failures
     fixed_failures = data[(data['completion_status'] == 'Failure') &\
                          (data['order_type'] == 'fixed')]
@@ -39,81 +48,90 @@ def process_data(data):
     # Drop all tests failed in random runs
     data = data[~(data['completion_status'] == 'Failure')]
 
-    def to_float_list(s):
-        list_ = [float(x) for x in s.split(',')]
-        if len(list_) == 1:
-            return list_[0]
-        else:
-            return list_
-
-    df_mem = data[data["test_command"].str.contains("run_memory")]
-    data = data[data["test_command"].str.contains("run_memory") == False]
-    df_mem['result'] = df_mem['result'].apply(to_float_list)
-
-    tests = ['copy_omp','scale_omp','add_omp', 'triad_omp']
-    for index, row in df_mem.iterrows():
-        results = row['result']
-        id = row['test_command']
-        for i,r in enumerate(results):
-            temp = row.copy()
-            temp['result'] = r
-            temp['test_command'] = id + ' -- ' + tests[i]
-            data = data.append(temp)
-
+    # Results made of several values are split into one row per value
+    data = expand_results(data, result_names)
 
     return data
 
-def run_stats(data, results_dir, timestamp):
+def run_stats(data, results_dir, timestamp, measures=None, result_names=None, jobs=None):
+    """ Compares fixed and random orders for each column of 'measures'
+    (defaults to the tests' result). Output files of a measure other than
+    result are prefixed with its name. Results with several values are
+    named after 'result_names' (see results_io.expand_results). Tests of
+    each configuration are spread over 'jobs' processes (config.stats_jobs
+    by default).
+    """
+    if measures is None:
+        measures = ['result']
+    if jobs is None:
+        jobs = config.stats_jobs
     # Process data, removing failures
-    data = process_data(data)
+    data = process_data(data, result_names)
+    for measure in measures:
+        if measure not in data.columns:
+            LOG.error("No column " + measure + " in the test results, skipping it")
+            continue
+        LOG.info("Running stats on " + measure)
+        LOG.info("----------------------------------------------")
+        prefix = results_dir + '/' + timestamp
+        if measure != 'result':
+            prefix += '_' + measure
+        measure_data = data.dropna(subset=[measure])
+        if measure_data.empty:
+            LOG.error("No values of " + measure + " in the test results, skipping it")
+            continue
+        run_measure_stats(measure_data, prefix, measure, jobs=jobs)
+
+def run_measure_stats(data, prefix, measure='result', jobs=1):
     # Record single or multinode and split data by order type
     n_nodes = len(data['hostname'].unique())
 
     if n_nodes == 1:
         LOG.info("Running stats for single node")
         LOG.info("----------------------------------------------")
-        node_stats, summary = run_group_stats(data)
-        node_stats.to_csv(results_dir + '/' + timestamp + '_node_stats.csv', index=False)
-        summary.to_csv(results_dir + '/' + timestamp + '_stats_summary.csv', index=False)
+        node_stats, summary = run_group_stats(data, measure=measure, jobs=jobs)
+        node_stats.to_csv(prefix + '_node_stats.csv', index=False)
+        summary.to_csv(prefix + '_stats_summary.csv', index=False)
     else:
         # run stats for all
         LOG.info("Running stats for combined nodes")
         LOG.info("----------------------------------------------")
-        combined_stats, summary_all = run_group_stats(data)
-        combined_stats.to_csv(results_dir + '/' + timestamp + '_combined_node_stats.csv', index=False)
-        combined_stats.to_csv(results_dir + '/' + timestamp + '_combined_stats_summary.csv', index=False)
+        combined_stats, summary_all = run_group_stats(data, measure=measure, jobs=jobs)
+        combined_stats.to_csv(prefix + '_combined_node_stats.csv', index=False)
+        combined_stats.to_csv(prefix + '_combined_stats_summary.csv', index=False)
         LOG.info("Running stats for individual nodes")
         LOG.info("----------------------------------------------")
-        single_node_stats, summary_ind = run_group_stats(data, group=['hostname','test_command'])
-        single_node_stats.to_csv(results_dir + '/' + timestamp + '_indv_node_stats.csv', index=False)
-        summary_ind.to_csv(results_dir + '/' + timestamp + '_indv_stats_summary.csv', index=False)
+        single_node_stats, summary_ind = run_group_stats(data, group=['hostname','test_command'],
+                                                         measure=measure, jobs=jobs)
+        single_node_stats.to_csv(prefix + '_indv_node_stats.csv', index=False)
+        summary_ind.to_csv(prefix + '_indv_stats_summary.csv', index=False)
         LOG.info("Comparing individual node stats with combined")
         LOG.info("----------------------------------------------")
         compared_stats = compare_nodes(combined_stats, single_node_stats)
-        compared_stats.to_csv(results_dir + '/' + timestamp + '_compared_stats.csv', index=False)
+        compared_stats.to_csv(prefix + '_compared_stats.csv', index=False)
 
-def run_group_stats(data, group=['test_command']):
-    fixed_data = data[data['order_type'] == 'fixed']
-    random_data = data[data['order_type'] == 'random']
+def run_group_stats(data, group=['test_command'], measure='result', jobs=1):
+    # Group and sort the values once for all the statistics below
+    samples = GroupedSamples(data, group, measure, jobs=jobs)
 
     # Shapiro-Wilk to test for normality
     LOG.info("Running Shapiro-Wilk on fixed data")
     LOG.info("----------------------------------------------")
-    shapiro_wilk_fixed, shapiro_summary_fixed = SW_test(fixed_data,"result",group,"fixed")
+    shapiro_wilk_fixed, shapiro_summary_fixed = SW_test(samples, "fixed")
 
     LOG.info("Running Shapiro-Wilk on random data")
     LOG.info("----------------------------------------------")
-    shapiro_wilk_random, shapiro_summary_random = SW_test(random_data,"result",group, "random")
+    shapiro_wilk_random, shapiro_summary_random = SW_test(samples, "random")
 
     # Kruskal Wallis
     LOG.info("Running Kruskal Wallis")
     LOG.info("----------------------------------------------")
-    kruskal_wallace = KW_test(data,"result", group)
+    kruskal_wallace = KW_test(samples)
 
     # CI testing
     LOG.info("Comparing Confidence Intervals")
     LOG.info("----------------------------------------------")
-    conf_intervals = CI_fixed_vs_random(data, "result", group)
+    conf_intervals = CI_fixed_vs_random(samples)
 
     stats_all = shapiro_wilk_fixed.merge(shapiro_wilk_random, how='outer', on=group)
     stats_all = stats_all.merge(kruskal_wallace, how='outer', on=group)
@@ -132,98 +150,69 @@ def run_group_stats(data, group=['test_command']):
     return stats_all, summary
 
 """##SHAPIRO WILK TEST"""
-def SW_test(df, measure, group, order):
-    df_cols = group + ['SW_test_stat_' + order,
-                     'SW_p-value_' + order,
-                     'Normal_' + order]
-    shapiro_wilk = pd.DataFrame(columns=df_cols)
-    shapiro_stats = pd.DataFrame(columns=['SW_num_not_normal_' + order,
-                                        'SW_number_normal_' + order,
-                                        'Fraction_not_normal_' + order])
-    for key, grp in df.groupby(group):
-        if len(group) == 1:
-            config = [key]
-        else:
-            config = list(key)
-        sw = stats.shapiro(grp[measure])
-        normal = True if sw[1] > 0.05 else False
-        shapiro_wilk.loc[len(shapiro_wilk)] = config + \
-                                            [sw[0],
-                                            sw[1],
-                                            normal]
-
-    num_not_normal = len(shapiro_wilk[shapiro_wilk["SW_p-value_" + order]<0.05])
+def SW_test(samples, order):
+    # Only configurations with results in this order are tested
+    tested = samples.n(order) > 0
+    sw_stat, sw_p = samples.shapiro(order)
+    shapiro_wilk = samples.keys[tested].reset_index(drop=True)
+    shapiro_wilk['SW_test_stat_' + order] = sw_stat[tested]
+    shapiro_wilk['SW_p-value_' + order] = sw_p[tested]
+    shapiro_wilk['Normal_' + order] = sw_p[tested] > 0.05
+
+    num_not_normal = int((sw_p[tested] < 0.05).sum())
     num_normal = len(shapiro_wilk) - num_not_normal
     frac_not_normal = num_not_normal / len(shapiro_wilk)
-    shapiro_stats.loc[len(shapiro_stats)] = [num_not_normal,
-                                            num_normal,
-                                            frac_not_normal]
+    shapiro_stats = pd.DataFrame([[num_not_normal, num_normal, frac_not_normal]],
+                                 columns=['SW_num_not_normal_' + order,
+                                          'SW_number_normal_' + order,
+                                          'Fraction_not_normal_' + order])
     LOG.info("Number of configurations not normally distributed " + str(num_not_normal))
     LOG.info("Number of configurations normally distributed " + str(num_normal))
     LOG.info("Fraction of configurations not normally distributed " + str(frac_not_normal))
 
     return shapiro_wilk, shapiro_stats
 
-def KW_test(df, measure, group):
+def KW_test(samples):
     # Samples with fewer than this number of values will not be considered
     sample_count_thresh = 50
-    kruskal_wallace = pd.DataFrame(columns = group + \
-                                            ['KW_dist_type',
-                                            'coeff_of_variation_fixed',
-                                            'coeff_of_variation_random',
-                                            'KW_test_stat',
-                                            'KW_p-value',
-                                            'percent_diff',
-                                            'KW_effect_size'])
 
     # Compare between fixed and random for each configuration
-    for idx, grp in df.groupby(group):
-        fixed_results = grp[grp.order_type == 'fixed'][measure].values
-        fixed_results = fixed_results.astype(np.float64)
-        random_results= grp[grp.order_type == 'random'][measure].values
-        random_results = random_results.astype(np.float64)
-
-        # run test and compute results
-        coef_of_var_f = round(stats.variation(fixed_results), 3)
-        coef_of_var_r = round(stats.variation(random_results), 3)
-        kw_stats = stats.kruskal(fixed_results, random_results)
-        p_diff = percent_difference(fixed_results, random_results)
-        effect_size = effect_size_eta_squared_KW(fixed_results, random_results, kw_stats[0])
-        kw_dist = get_distribution(kw_stats[1])
-        # needed for use with group size of one or >1
-        if len(group) == 1:
-            config = [idx]
-        else:
-            config = list(idx)
-        #WHEN SUFFICIENT DATA IS PRESENT
-        # if (len(random_sample) >= sample_count_thresh) and (len(seq_sample) >= sample_count_thresh):
-        kruskal_wallace.loc[len(kruskal_wallace)] = config + \
-                                                [kw_dist,
-                                                coef_of_var_f,
-                                                coef_of_var_r,
-                                                kw_stats[0],
-                                                kw_stats[1],
-                                                p_diff,
-                                                effect_size]
+    kw_stat, kw_p = samples.kruskal()
+    n = samples.n('fixed') + samples.n('random')
+    kruskal_wallace = samples.keys.copy()
+    # Undefined outcomes (e.g. all values tied, or one order missing) stay NaN
+    kruskal_wallace['KW_dist_type'] = np.where(np.isnan(kw_p), None,
+                                               np.where(kw_p > 0.05, 'same', 'different'))
+    kruskal_wallace['coeff_of_variation_fixed'] = np.round(samples.variation('fixed'), 3)
+    kruskal_wallace['coeff_of_variation_random'] = np.round(samples.variation('random'), 3)
+    kruskal_wallace['KW_test_stat'] = kw_stat
+    kruskal_wallace['KW_p-value'] = kw_p
+    kruskal_wallace['percent_diff'] = percent_difference(samples.mean('fixed'),
+                                                         samples.mean('random'))
+    kruskal_wallace['KW_effect_size'] = effect_size_eta_squared_KW(n, kw_stat)
+    #WHEN SUFFICIENT DATA IS PRESENT
+    # if (len(random_sample) >= sample_count_thresh) and (len(seq_sample) >= sample_count_thresh):
 
     return kruskal_wallace
 
 def get_distribution(p_val):
     return 'same' if p_val > 0.05 else 'different'
 
-def percent_difference(v_control, v_experiment):
+def percent_difference(mean_control, mean_experiment):
     # The paper reports this as fixed-random/fixed * 100
-    return ((v_control.mean() - v_experiment.mean()) / v_control.mean()) * 100
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return ((mean_control - mean_experiment) / mean_control) * 100
 
-def effect_size_eta_squared_KW(v_control, v_experiment, kw_H):
+def effect_size_eta_squared_KW(n, kw_H):
     """
-    Returns the ets_sqared measure for effect size calculated for the KW test
+    Returns the ets_sqared measure for effect size calculated for the KW test,
+    given the total number of values 'n' of both samples.
     For details see: http://www.tss.awf.poznan.pl/files/3_Trends_Vol21_2014__no1_20.pdf
     (Chose eta_squared over the epsilon squared since it is the more popular method)
     """
     k = 1
-    n = len(v_experiment) + len(v_control)
-    return ((kw_H-k + 1)/(n-k))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return ((kw_H-k + 1)/(n-k))
 
 def get_median(df):
     try:
@@ -238,61 +227,73 @@ def get_percentile(df, quant):
         return np.nan
 
 
-def CI_fixed_vs_random(data, measure, group, alpha = 0.95, p = 0.5):
-    df = pd.DataFrame(columns=group +["fixed_pth_quantile",
-                                      "fixed_ci_low",
-                                      "fixed_ci_high",
-                                      "random_pth_quantile",
-                                      "random_ci_low",
-                                      "random_ci_high",
-                                      "ci_case",
-                                      "inner_diff"])
-
-    hypotheses = data.nunique()[group][0]
+def CI_fixed_vs_random(samples, alpha = 0.95, p = 0.5, tail_quantiles = None):
+    """ Compares the CIs of the p-quantile of fixed and random orders, and
+    of each tail quantile (config.stats_tail_quantiles by default), reported
+    in columns labeled with the quantile (e.g. fixed_p99, ci_case_p99)
+    """
+    if tail_quantiles is None:
+        tail_quantiles = config.stats_tail_quantiles
+    tail_quantiles = [q for q in tail_quantiles if q != p]
+    hypotheses = samples.keys[samples.group[0]].nunique()
     # apply Bonferroni correction: https://www.statology.org/bonferroni-correction/
     alpha = 1 - ( 1 - alpha ) / hypotheses
-    for idx,grp in data.groupby(group):
-        fixed_results = grp[grp.order_type == 'fixed'][measure].values
-        fixed_results = fixed_results.astype(np.float64)
-        random_results= grp[grp.order_type == 'random'][measure].values
-        random_results = random_results.astype(np.float64)
-
-        f_m,f_lo,f_hi = get_ci(fixed_results, alpha=alpha, p=p)
-        r_m,r_lo,r_hi = get_ci(random_results, alpha=alpha, p=p)
-
-        # needed for use with group size of one or >1
-        if len(group) == 1:
-            config = [idx]
-        else:
-            config = list(idx)
-
-        # Check CI overlap cases
-        # Calculating the inner difference
-        if(r_hi>f_hi):
-            inner_diff = r_lo - f_hi
-            if inner_diff > 0:
-                case = 1
-            elif (f_m >= r_lo) or (r_m <= f_hi):
-                case = 2
-                inner_diff = None
-            else:
-                case = 3
-                inner_diff = None
-        else:
-            inner_diff = f_lo - r_hi
-            if inner_diff > 0:
-                case = 1
-            elif (r_m > f_lo) or (f_m < r_hi):
-                case = 2
-                inner_diff = None
-            else:
-                case = 3
-                inner_diff = None
-
-        df.loc[len(df)] = config + [f_m,f_lo,f_hi,r_m,r_lo,r_hi,case, inner_diff]
-
+    fixed_cis = samples.quantile_cis('fixed', [p] + tail_quantiles, alpha)
+    random_cis = samples.quantile_cis('random', [p] + tail_quantiles, alpha)
+    f_m, f_lo, f_hi = fixed_cis[p]
+    r_m, r_lo, r_hi = random_cis[p]
+    case, inner_diff = get_ci_cases(f_m, f_lo, f_hi, r_m, r_lo, r_hi)
+
+    df = samples.keys.copy()
+    df["fixed_pth_quantile"] = f_m
+    df["fixed_ci_low"] = f_lo
+    df["fixed_ci_high"] = f_hi
+    df["random_pth_quantile"] = r_m
+    df["random_ci_low"] = r_lo
+    df["random_ci_high"] = r_hi
+    df["ci_case"] = case
+    df["inner_diff"] = inner_diff
+    for q in tail_quantiles:
+        label = quantile_label(q)
+        f_m, f_lo, f_hi = fixed_cis[q]
+        r_m, r_lo, r_hi = random_cis[q]
+        df["fixed_" + label] = f_m
+        df["fixed_" + label + "_ci_low"] = f_lo
+        df["fixed_" + label + "_ci_high"] = f_hi
+        df["random_" + label] = r_m
+        df["random_" + label + "_ci_low"] = r_lo
+        df["random_" + label + "_ci_high"] = r_hi
+        df["ci_case_" + label], df["inner_diff_" + label] = \
+            get_ci_cases(f_m, f_lo, f_hi, r_m, r_lo, r_hi)
     return df
 
+def get_ci_cases(f_m, f_lo, f_hi, r_m, r_lo, r_hi):
+    """
+    Classifies how the fixed and random CIs overlap, element-wise over arrays
+    of CIs, and returns the cases with the inner differences between the CIs
+    (NaN unless they do not overlap):
+    1 - non-overlapping
+    2 - overlapping, with the quantile of one contained in the CI of the other
+    3 - overlapping, with both quantiles outside the CI of the other
+    """
+    with np.errstate(invalid='ignore'):
+        random_higher = r_hi > f_hi
+        inner_diff = np.where(random_higher, r_lo - f_hi, f_lo - r_hi)
+        contained = np.where(random_higher,
+                             (f_m >= r_lo) | (r_m <= f_hi),
+                             (r_m > f_lo) | (f_m < r_hi))
+        disjoint = inner_diff > 0
+    case = np.where(disjoint, 1, np.where(contained, 2, 3))
+    return case, np.where(disjoint, inner_diff, np.nan)
+
+def get_ci_case(f_m, f_lo, f_hi, r_m, r_lo, r_hi):
+    """ get_ci_cases for a single pair of CIs, with an inner difference of
+    None unless they do not overlap
+    """
+    case, inner_diff = get_ci_cases(*(np.float64(v) for v in (f_m, f_lo, f_hi, r_m, r_lo, r_hi)))
+    inner_diff = float(inner_diff)
+    return int(case), (None if np.isnan(inner_diff) else inner_diff)
+
 def get_ci(s,  alpha=0.95, p=0.5, n_thresh=10):
     """
     For values in the given array s and p in [0, 1], this fuction returns
@@ -302,15 +303,8 @@ def get_ci(s,  alpha=0.95, p=0.5, n_thresh=10):
     (Page 36 describes how nonparametric confidence intervals can be obtained
     for p-quantiles)
     """
-    n = len(s)
-    q = np.quantile(s, p)
-    eta = stats.norm.ppf((1+alpha)/2.0) # 1.96 for alpha = 0.95
-    lo_rank = max(int(np.floor(n * p - eta * np.sqrt(n * p * (1-p)))), 0)
-    hi_rank = min(int(np.ceil(n * p + eta * np.sqrt(n * p * (1-p))) + 1), n-1)
-    s_sorted = sorted(s.tolist())
-    q_ci_lo = s_sorted[lo_rank]
-    q_ci_hi = s_sorted[hi_rank]
-    return q, q_ci_lo, q_ci_hi
+    q, q_ci_lo, q_ci_hi = quantile_cis(s, [p], alpha=alpha)
+    return q[0], q_ci_lo[0], q_ci_hi[0]
 
 def compare_nodes(combined_stats, single_stats):
     compared_stats = combined_stats[['test_command']].copy()
@@ -321,7 +315,7 @@ def compare_nodes(combined_stats, single_stats):
     dist_overview = []
 
     # Run through each node and generate stats on distribution by test
-    for idx, group in single_stats.groupby(['hostname']):
+    for idx, group in single_stats.groupby('hostname', observed=True):
         ss = group[['test_command']].copy()
         ss['KW_dist_type_' + idx] = group['KW_dist_type']
         ss['CI_case_' + idx] = group['ci_case']
@@ -329,7 +323,7 @@ def compare_nodes(combined_stats, single_stats):
         ss['COV_random_' + idx] = group['coeff_of_variation_random']
         compared_stats = compared_stats.merge(ss, how='outer', on='test_command')
         overview = compared_stats['KW_dist_type_' + idx].tolist()
-        overview = list(map((lambda x: x[0]), overview))
+        overview = list(map((lambda x: x[0] if isinstance(x, str) else '?'), overview))
         dist_overview.append(overview)
 
     # Transpose overview list and add as column
@@ -348,11 +342,11 @@ def main():
         df = pd.read_csv('examples/test_data.csv')
         results_dir = 'examples'
     else:
-        df = pd.read_csv(args.file)
+        df = load_table(args.file, kind="test")
         results_dir = args.results_dir
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H:%M:%S")
-    run_stats(df, results_dir, timestamp)
+    run_stats(df, results_dir, timestamp, measures=args.measures.split(','), jobs=args.jobs)
 
 if __name__ == "__main__":
     main()